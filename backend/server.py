@@ -1,80 +1,1175 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Deque, Tuple
 import uuid
+import base64
+import re
 from datetime import datetime
 import json
 import asyncio
+import time
+from collections import OrderedDict, deque
 from datetime import datetime
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# orjson is an optional speed-up; without it the stdlib encoder is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Custom JSON encoder for datetime objects
 def json_serializer(obj):
     """JSON serializer for objects not serializable by default json code"""
     if isinstance(obj, datetime):
         return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
     raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
 
 def safe_json_dumps(data):
-    """Safely serialize data to JSON with datetime support"""
+    """Safely serialize data to JSON with datetime and pydantic model support"""
+    if orjson is not None:
+        return orjson.dumps(data, default=json_serializer, option=orjson.OPT_NON_STR_KEYS).decode()
     return json.dumps(data, default=json_serializer)
 
+def encode_event(event_type: str, **fields) -> str:
+    """Encode a WebSocket frame once; pydantic models are dumped straight to JSON by pydantic-core"""
+    plain = {"type": event_type}
+    models = []
+    for name, value in fields.items():
+        if isinstance(value, BaseModel):
+            models.append(f'{safe_json_dumps(name)}:{value.model_dump_json()}')
+        else:
+            plain[name] = value
+    encoded = safe_json_dumps(plain)
+    if not models:
+        return encoded
+    return encoded[:-1] + "," + ",".join(models) + "}"
+
+# Commands slower than this are logged, and reads among them are explained to spot collection scans
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Session and routing fields the driver adds to a command that explain must not be given
+DRIVER_COMMAND_FIELDS = {"lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "readConcern", "writeConcern"}
+# Each namespace and query shape is explained at most once per cooldown, however often it is slow
+SLOW_QUERY_EXPLAIN_COOLDOWN_MS = int(os.environ.get('SLOW_QUERY_EXPLAIN_COOLDOWN_MS', '300000'))
+
+def query_shape(value):
+    """value with every literal replaced, so commands differing only in their values compare equal"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        shapes = []
+        for shape in map(query_shape, value):
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+def command_shape(database_name: str, command_name: str, command: dict) -> tuple:
+    namespace = f"{database_name}.{command.get(command_name)}"
+    rest = {key: value for key, value in command.items() if key != command_name and key not in DRIVER_COMMAND_FIELDS}
+    return namespace, command_name, repr(query_shape(rest))
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Logs slow MongoDB commands and warns when one of them ran as a collection scan"""
+
+    def __init__(self, cooldown: float = SLOW_QUERY_EXPLAIN_COOLDOWN_MS / 1000):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.cooldown = cooldown
+        self._commands: Dict[int, tuple] = {}
+        # command shape -> when it was last explained, oldest first
+        self._explained: "OrderedDict[tuple, float]" = OrderedDict()
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            self._commands[event.request_id] = (event.database_name, event.command_name, event.command)
+
+    def succeeded(self, event):
+        command = self._commands.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < SLOW_QUERY_MS:
+            return
+        logger.warning("Slow MongoDB %s took %.1f ms", event.command_name, duration_ms)
+        # Listener callbacks run on the driver's threads; the explain runs on the app's loop
+        if command is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.explain, *command)
+
+    def failed(self, event):
+        self._commands.pop(event.request_id, None)
+
+    def explain(self, database_name: str, command_name: str, command: dict):
+        """Explain a slow command unless its shape was explained within the cooldown; runs on the app's loop"""
+        now = time.monotonic()
+        while self._explained and next(iter(self._explained.values())) <= now - self.cooldown:
+            self._explained.popitem(last=False)
+        shape = command_shape(database_name, command_name, command)
+        if shape in self._explained:
+            return
+        self._explained[shape] = now
+        asyncio.ensure_future(explain_slow_query(database_name, command))
+
+def has_collection_scan(plan) -> bool:
+    """Whether an explain plan contains a COLLSCAN stage"""
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(has_collection_scan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(has_collection_scan(value) for value in plan)
+    return False
+
+async def explain_slow_query(database_name: str, command: dict):
+    command = {key: value for key, value in command.items() if key not in DRIVER_COMMAND_FIELDS}
+    try:
+        explained = await client[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+    except PyMongoError:
+        return
+    if has_collection_scan(explained.get("queryPlanner")):
+        logger.warning("Slow query fell back to a collection scan: %s", command)
+
+slow_queries = SlowQueryListener()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[slow_queries])
 db = client[os.environ['DB_NAME']]
 
+# Indexes backing every query pattern in this module, created idempotently on startup
+COLLECTION_INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("is_banned", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "competitions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "live_voting": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("competition_id", ASCENDING), ("is_active", ASCENDING)]),
+    ],
+    "live_voting_ballots": [
+        # One ballot per voter per live voting session
+        IndexModel([("voting_session_id", ASCENDING), ("voter_id", ASCENDING)], unique=True),
+    ],
+    "votes": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # One vote per voter per participant; also serves the per-competition results
+        IndexModel(
+            [("competition_id", ASCENDING), ("participant_id", ASCENDING), ("voter_id", ASCENDING)],
+            unique=True
+        ),
+    ],
+    "messages": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("competition_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "admin_actions": [
+        IndexModel([("timestamp", DESCENDING)]),
+    ],
+    "moderation_rules": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "reactions": [
+        # One counter document per participant per competition
+        IndexModel([("competition_id", ASCENDING), ("participant_id", ASCENDING)], unique=True),
+    ],
+}
+
+# Unique indexes that enforce one vote per voter. Data written before they existed may
+# hold duplicates; when building the index fails on them they are removed and the build
+# retried. The sort puts the copy to keep first. Startup fails if the index still cannot be built.
+VOTER_UNIQUE_KEYS: Dict[str, tuple] = {
+    # cast_vote overwrites the earlier vote, so the latest one wins
+    "votes": (["competition_id", "participant_id", "voter_id"], [("timestamp", DESCENDING)]),
+    # Only the first ballot should have counted
+    "live_voting_ballots": (["voting_session_id", "voter_id"], [("timestamp", ASCENDING)]),
+}
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# WebSocket fan-out settings
+# Each socket gets its own bounded outbound queue drained by a writer task, so a
+# slow viewer only ever backs up its own queue. The policy decides what happens
+# when that queue is full:
+#   drop_oldest - discard the oldest pending frame
+#   coalesce    - replace a pending frame with the same key (e.g. the latest
+#                 tally for a voting session), otherwise discard the oldest
+#   disconnect  - close the slow socket
+SEND_POLICY_DROP_OLDEST = "drop_oldest"
+SEND_POLICY_COALESCE = "coalesce"
+SEND_POLICY_DISCONNECT = "disconnect"
+SEND_POLICIES = (SEND_POLICY_DROP_OLDEST, SEND_POLICY_COALESCE, SEND_POLICY_DISCONNECT)
+
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '256'))
+WS_SEND_POLICY = os.environ.get('WS_SEND_POLICY', SEND_POLICY_COALESCE)
+if WS_SEND_POLICY not in SEND_POLICIES:
+    raise ValueError(f"WS_SEND_POLICY must be one of {', '.join(SEND_POLICIES)}")
+
+class ClientConnection:
+    """Outbound side of a single WebSocket: a bounded send queue and its writer task"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        user_id: Optional[str] = None,
+        on_closed: Optional[Callable[["ClientConnection"], None]] = None,
+        policy: str = WS_SEND_POLICY,
+        max_queue: int = WS_SEND_QUEUE_SIZE
+    ):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.on_closed = on_closed
+        self.policy = policy
+        self.max_queue = max_queue
+        self.closed = False
+        self.dropped = 0
+        # Entries are [key, message] lists so a coalesced frame can be swapped in place
+        self._queue: Deque[list] = deque()
+        self._pending: Dict[str, list] = {}
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._run())
+
+    def enqueue(self, message: str, key: Optional[str] = None) -> bool:
+        """Queue a frame without waiting for the socket. Returns False if it was not queued."""
+        if self.closed:
+            return False
+        if key is not None and self.policy == SEND_POLICY_COALESCE:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = message
+                return True
+        if len(self._queue) >= self.max_queue:
+            if self.policy == SEND_POLICY_DISCONNECT:
+                logger.warning("Disconnecting slow WebSocket consumer (%d frames pending)", len(self._queue))
+                self.close(code=1013)
+                return False
+            self._forget(self._queue.popleft())
+            self.dropped += 1
+        entry = [key, message]
+        self._queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._ready.set()
+        return True
+
+    def close(self, code: int = 1000):
+        """Close the socket from the server side and drop it from its room"""
+        if self.closed:
+            return
+        self.stop()
+        asyncio.create_task(self._close_socket(code))
+        self._notify_closed()
+
+    def stop(self):
+        """Stop the writer once the socket is already gone"""
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def _notify_closed(self):
+        if self.on_closed is not None:
+            self.on_closed(self)
+
+    def _forget(self, entry: list):
+        key = entry[0]
+        if key is not None and self._pending.get(key) is entry:
+            del self._pending[key]
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                entry = self._queue.popleft()
+                self._forget(entry)
+                await self.websocket.send_text(entry[1])
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # The socket is gone; evict it now rather than retrying it on every broadcast
+            logger.info("Dropping WebSocket after failed send: %s", exc)
+            self.stop()
+            self._notify_closed()
+
+# Room broadcasts go through a backplane so every worker serving /ws sees them.
+# "memory" keeps them in this process; "mongo" shares them between processes and
+# hosts through a change stream on the broadcasts collection (needs a replica set).
+BROADCAST_BACKPLANE = os.environ.get('BROADCAST_BACKPLANE', 'memory')
+# Room id used for frames meant for every connected socket
+ALL_ROOMS = "*"
+# Room id for cache-sync messages between workers; never delivered to sockets
+CONTROL_ROOM = "__control__"
+
+class Backplane:
+    """Carries room broadcasts to the local delivery function of every worker"""
+
+    def __init__(self):
+        self.deliver: Optional[Callable[[str, str, Optional[str]], None]] = None
+
+    def attach(self, deliver: Callable[[str, str, Optional[str]], None]):
+        self.deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def publish(self, room_id: str, message: str, key: Optional[str] = None):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane: publishing is local delivery"""
+
+    async def publish(self, room_id: str, message: str, key: Optional[str] = None):
+        self.deliver(room_id, message, key)
+
+class MongoChangeStreamBackplane(Backplane):
+    """Shares broadcasts between workers through inserts into a collection and a change stream on it"""
+
+    def __init__(self, collection, batch_size: int = 500):
+        super().__init__()
+        self.collection = collection
+        self.batch_size = batch_size
+        self.node_id = str(uuid.uuid4())
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._publish_loop()), asyncio.create_task(self._watch_loop())]
+
+    async def publish(self, room_id: str, message: str, key: Optional[str] = None):
+        # Local sockets never wait for the round trip through MongoDB
+        self.deliver(room_id, message, key)
+        self._outbox.put_nowait({
+            "node": self.node_id,
+            "room_id": room_id,
+            "message": message,
+            "key": key,
+            "created_at": datetime.utcnow()
+        })
+
+    async def _publish_loop(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty() and len(batch) < self.batch_size:
+                batch.append(self._outbox.get_nowait())
+            try:
+                await self.collection.insert_many(batch)
+            except PyMongoError:
+                logger.exception("Could not publish %d broadcasts to other workers", len(batch))
+
+    async def _watch_loop(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.node": {"$ne": self.node_id}}}]
+        resume_token = None
+        while True:
+            try:
+                async with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        doc = change["fullDocument"]
+                        self.deliver(doc["room_id"], doc["message"], doc.get("key"))
+            except PyMongoError:
+                logger.exception("Broadcast change stream failed; reconnecting")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+def create_backplane() -> Backplane:
+    if BROADCAST_BACKPLANE == "mongo":
+        # Broadcast documents only need to live long enough to reach the other workers
+        COLLECTION_INDEXES["broadcasts"] = [IndexModel([("created_at", ASCENDING)], expireAfterSeconds=60)]
+        return MongoChangeStreamBackplane(db.broadcasts)
+    if BROADCAST_BACKPLANE != "memory":
+        raise ValueError("BROADCAST_BACKPLANE must be memory or mongo")
+    return InMemoryBackplane()
+
+# Every frame delivered to a room is stamped with that room's next sequence number
+# and kept in a bounded log, so a client that reconnects to the same worker (same
+# epoch) can be sent just the frames it missed. Keyed frames that coalesce in a
+# send queue leave gaps in the sequence a client sees.
+WS_EVENT_LOG_SIZE = int(os.environ.get('WS_EVENT_LOG_SIZE', '1000'))
+# A room's log outlives its last local viewer by this long, so a quick reconnect can still resume
+WS_EVENT_LOG_GRACE_MS = int(os.environ.get('WS_EVENT_LOG_GRACE_MS', '30000'))
+
+class RoomEventLog:
+    """The latest sequenced frames of one room on this worker"""
+
+    def __init__(self, size: int = WS_EVENT_LOG_SIZE):
+        self.seq = 0
+        self.events: Deque[tuple] = deque(maxlen=size)
+        # Pending removal while the room has no local viewers
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def keep(self):
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+
+    def append(self, message: str) -> str:
+        self.seq += 1
+        # Frames are JSON objects from encode_event; splice the number in instead of re-encoding
+        message = f'{{"seq":{self.seq},{message[1:]}'
+        self.events.append((self.seq, message))
+        return message
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """Frames after seq, or None when the log no longer reaches back that far"""
+        if seq > self.seq or seq < 0:
+            return None
+        missed = self.seq - seq
+        if missed > len(self.events):
+            return None
+        return [message for _, message in list(self.events)[len(self.events) - missed:]]
+
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.rooms: Dict[str, List[WebSocket]] = {}
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # Dicts keep join order and make joins, leaves and evictions O(1)
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.rooms: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.event_logs: Dict[str, RoomEventLog] = {}
+        self.event_log_grace = WS_EVENT_LOG_GRACE_MS / 1000
+        self.backplane = backplane or InMemoryBackplane()
+        self.backplane.attach(self.deliver_local)
+        self.node_id = str(uuid.uuid4())
+        self.control_handlers: Dict[str, Callable[[dict], None]] = {}
+
+    async def start(self):
+        await self.backplane.start()
+
+    async def close(self):
+        await self.backplane.close()
 
-    async def connect(self, websocket: WebSocket, room_id: str):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        user_id: Optional[str] = None,
+        since: Optional[int] = None,
+        epoch: Optional[str] = None,
+        snapshot: Optional[Callable[[str], Awaitable[Tuple[int, str]]]] = None
+    ) -> bool:
+        """Join a room, sending the frames missed since seq or else the room's snapshot
+
+        snapshot(room_id) returns the room's sequence number when it started
+        reading state together with the encoded snapshot frame. Returns True
+        when the client was resumed from the event log.
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
-        if room_id not in self.rooms:
-            self.rooms[room_id] = []
-        self.rooms[room_id].append(websocket)
+        log = self.event_logs.setdefault(room_id, RoomEventLog())
+        backlog = None
+        # Sequence numbers only mean something on the worker (and process) that assigned them
+        if since is not None and epoch == self.node_id:
+            backlog = log.since(since)
+        resumed = backlog is not None
+        if not resumed and snapshot is not None:
+            try:
+                backlog = await self._snapshot_backlog(room_id, snapshot)
+            except BaseException:
+                self._expire_log_later(room_id)
+                raise
+        # Registered and queued without an await in between, so no live frame slips in or repeats
+        log.keep()
+        client = ClientConnection(websocket, room_id, user_id, on_closed=self._evict)
+        client.start()
+        self.active_connections[websocket] = client
+        self.rooms.setdefault(room_id, {})[websocket] = client
+        for message in backlog or ():
+            client.enqueue(message)
+        return resumed
+
+    async def _snapshot_backlog(self, room_id: str, snapshot) -> List[str]:
+        """The snapshot frame followed by the logged frames delivered since it started reading"""
+        seq, frame = await snapshot(room_id)
+        log = self.event_logs.get(room_id)
+        return [frame, *((log.since(seq) if log is not None else None) or ())]
+
+    async def resync(self, websocket: WebSocket, snapshot):
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        for message in await self._snapshot_backlog(client.room_id, snapshot):
+            client.enqueue(message)
+
+    def room_seq(self, room_id: str) -> int:
+        log = self.event_logs.get(room_id)
+        return log.seq if log is not None else 0
+
+    def discard_event_log(self, room_id: str):
+        log = self.event_logs.pop(room_id, None)
+        if log is not None:
+            log.keep()
+
+    def disconnect(self, websocket: WebSocket):
+        """Forget a socket; safe to call again for one that is already gone"""
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        client.stop()
+        room = self.rooms.get(client.room_id)
+        if room is not None:
+            room.pop(websocket, None)
+            if not room:
+                del self.rooms[client.room_id]
+                self._expire_log_later(client.room_id)
+
+    def _expire_log_later(self, room_id: str):
+        """Drop the room's event log unless a viewer rejoins within the grace period"""
+        log = self.event_logs.get(room_id)
+        if log is None or room_id in self.rooms:
+            return
+        log.keep()
+        try:
+            log.expiry = asyncio.get_running_loop().call_later(self.event_log_grace, self._expire_log, room_id, log)
+        except RuntimeError:
+            del self.event_logs[room_id]
 
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        self.active_connections.remove(websocket)
-        if room_id in self.rooms:
-            self.rooms[room_id].remove(websocket)
+    def _expire_log(self, room_id: str, log: RoomEventLog):
+        if self.event_logs.get(room_id) is log and room_id not in self.rooms:
+            del self.event_logs[room_id]
+
+    def _evict(self, client: ClientConnection):
+        self.disconnect(client.websocket)
+
+    def disconnect_user(self, user_id: str, code: int = 1000):
+        """Close every socket this worker holds for a user"""
+        for client in [client for client in self.active_connections.values() if client.user_id == user_id]:
+            client.close(code)
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            client.enqueue(message)
 
-    async def broadcast_to_room(self, message: str, room_id: str):
-        if room_id in self.rooms:
-            for connection in self.rooms[room_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    pass
+    async def broadcast_to_room(self, message: str, room_id: str, key: Optional[str] = None):
+        """Publish a frame to the room on every worker; never waits on a socket"""
+        await self.backplane.publish(room_id, message, key)
 
     async def broadcast_to_all(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+        await self.backplane.publish(ALL_ROOMS, message)
+
+    def on_control(self, kind: str, handler: Callable[[dict], None]):
+        """Run handler for control messages of this kind published by other workers"""
+        self.control_handlers[kind] = handler
+
+    async def publish_control(self, kind: str, **payload):
+        """Tell the other workers about a change this worker has already applied locally"""
+        if isinstance(self.backplane, InMemoryBackplane):
+            # Nobody else to tell, so the payload is not even encoded
+            return
+        await self.backplane.publish(CONTROL_ROOM, safe_json_dumps({"kind": kind, "node": self.node_id, **payload}))
+
+    def _dispatch_control(self, message: str):
+        payload = json.loads(message)
+        handler = self.control_handlers.get(payload.get("kind"))
+        if handler is not None and payload.get("node") != self.node_id:
+            handler(payload)
+
+    def deliver_local(self, room_id: str, message: str, key: Optional[str] = None):
+        """Queue a frame for this worker's sockets in the room"""
+        if room_id == CONTROL_ROOM:
+            self._dispatch_control(message)
+            return
+        if room_id == ALL_ROOMS:
+            for room in set(self.rooms).union(self.event_logs):
+                self._deliver_room(room, message, key)
+        else:
+            self._deliver_room(room_id, message, key)
+
+    def _deliver_room(self, room_id: str, message: str, key: Optional[str]):
+        log = self.event_logs.get(room_id)
+        if log is not None:
+            message = log.append(message)
+        connections = self.rooms.get(room_id)
+        if not connections:
+            return
+        # A full queue under the disconnect policy evicts its socket mid-loop
+        for client in list(connections.values()):
+            client.enqueue(message, key)
+
+manager = ConnectionManager(create_backplane())
+
+class LruCache:
+    """Mapping that drops its least recently used entries past max_size and, given a ttl, entries older than that"""
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def _expired(self, entry: tuple, now: float) -> bool:
+        return entry[0] is not None and entry[0] <= now
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if self._expired(entry, time.monotonic()):
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        now = time.monotonic()
+        self._entries[key] = (None if self.ttl is None else now + self.ttl, value)
+        self._entries.move_to_end(key)
+        # Past max_size, and while the least recently used entry has expired, the oldest go
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_size and not self._expired(oldest, now):
+                break
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+class SingleFlight:
+    """At most one load per key at a time; concurrent callers for a key share its result"""
+
+    def __init__(self):
+        self._running: Dict[Any, asyncio.Future] = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._running
 
-manager = ConnectionManager()
+    async def run(self, key, load: Callable[[], Awaitable[Any]]):
+        running = self._running.get(key)
+        if running is None:
+            running = self._running[key] = asyncio.ensure_future(load())
+            running.add_done_callback(lambda done: self._finished(key, done))
+        # A caller that gives up does not cancel the load for the others
+        return await asyncio.shield(running)
+
+    def _finished(self, key, done: asyncio.Future):
+        if self._running.get(key) is done:
+            del self._running[key]
+
+# User profiles are read far more often than they change; entries expire after
+# USER_CACHE_TTL seconds and the least recently used go first once the cache is full
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+
+class UserCache:
+    """LRU + TTL cache of user documents keyed by user id"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.entries = LruCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self) -> int:
+        return self.entries.max_size
+
+    @property
+    def ttl(self) -> float:
+        return self.entries.ttl
+
+    @ttl.setter
+    def ttl(self, ttl: float):
+        self.entries.ttl = ttl
+
+    async def get_many(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Users by id; the ones not cached are fetched with a single $in query"""
+        found = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user = self.entries.get(user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = user
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            async for user in db.users.find({"id": {"$in": missing}}, WITHOUT_OBJECT_ID):
+                self.entries.put(user["id"], user)
+                found[user["id"]] = user
+        return found
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return (await self.get_many([user_id])).get(user_id)
+
+    def discard(self, user_id: str):
+        self.entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+user_cache = UserCache()
+
+# WebSocket close code for sockets refused or dropped because the user is banned
+WS_CLOSE_BANNED = 4403
+
+class BanList:
+    """Ids of banned users, checked on every write path without a database round trip"""
+
+    def __init__(self):
+        self.user_ids: set = set()
+
+    async def load(self):
+        banned = await db.users.find({"is_banned": True}, {"_id": 0, "id": 1}).to_list(None)
+        self.user_ids = {user["id"] for user in banned}
+
+    def is_banned(self, user_id: Optional[str]) -> bool:
+        return user_id in self.user_ids
+
+    def ensure_allowed(self, user_id: str):
+        if user_id in self.user_ids:
+            raise HTTPException(status_code=403, detail="User is banned")
+
+    def set_banned(self, user_id: str, banned: bool):
+        user_cache.discard(user_id)
+        if banned:
+            self.user_ids.add(user_id)
+            manager.disconnect_user(user_id, WS_CLOSE_BANNED)
+        else:
+            self.user_ids.discard(user_id)
+
+    def apply_changed(self, payload: dict):
+        self.set_banned(payload["user_id"], payload["banned"])
+
+bans = BanList()
+manager.on_control("user_ban_changed", bans.apply_changed)
+
+# Live voting tallies are broadcast in ticks rather than once per vote
+VOTING_TICK_MS = int(os.environ.get('VOTING_TICK_MS', '200'))
+
+class VotingTallyAggregator:
+    """Collects live-vote counts per competition and broadcasts only the changed options once per tick"""
+
+    def __init__(self):
+        # competition_id -> voting_session_id -> option -> latest count
+        self.pending: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.tick_seconds: Dict[str, float] = {}
+        self._tickers: Dict[str, asyncio.Task] = {}
+
+    async def record(self, competition_id: str, session_id: str, option: str, count: int):
+        session_counts = self.pending.setdefault(competition_id, {}).setdefault(session_id, {})
+        # Counts only grow, so a late reply from a concurrent vote must not move one backwards
+        if count > session_counts.get(option, -1):
+            session_counts[option] = count
+        if competition_id not in self._tickers:
+            if competition_id not in self.tick_seconds:
+                self.tick_seconds[competition_id] = await self._load_tick_seconds(competition_id)
+            if competition_id not in self._tickers:
+                self._tickers[competition_id] = asyncio.create_task(self._tick(competition_id))
+
+    async def _load_tick_seconds(self, competition_id: str) -> float:
+        comp = await db.competitions.find_one({"id": competition_id}, {"_id": 0, "voting_tick_ms": 1})
+        tick_ms = (comp or {}).get("voting_tick_ms") or VOTING_TICK_MS
+        return tick_ms / 1000
+
+    async def _tick(self, competition_id: str):
+        try:
+            while True:
+                await asyncio.sleep(self.tick_seconds[competition_id])
+                changed = self.pending.pop(competition_id, None)
+                if not changed:
+                    # Idle competitions do not keep a ticker around
+                    break
+                await manager.broadcast_to_room(
+                    encode_event(
+                        "voting_update",
+                        competition_id=competition_id,
+                        updates=[
+                            {"voting_session_id": session_id, "votes": votes}
+                            for session_id, votes in changed.items()
+                        ]
+                    ),
+                    competition_id
+                )
+        finally:
+            self._tickers.pop(competition_id, None)
+
+    def close(self):
+        for ticker in list(self._tickers.values()):
+            ticker.cancel()
+        self._tickers.clear()
+        self.pending.clear()
+
+voting_tallies = VotingTallyAggregator()
+
+# How many times a rebuild recounts competitions that other workers voted in meanwhile
+LEADERBOARD_RECOUNT_ROUNDS = 5
+
+class LeaderboardCache:
+    """Running star-rating totals per (competition, participant), kept current by cast_vote
+
+    The worker that stores a vote applies it and publishes the delta as a
+    vote_scored control message, so every worker's totals stay the same.
+    """
+
+    def __init__(self):
+        # competition_id -> participant_id -> [rating total, vote count]
+        self.scores: Dict[str, Dict[str, List[int]]] = {}
+        # Last ranking pushed to each competition room
+        self.rankings: Dict[str, List[str]] = {}
+        self.loaded = False
+        # Competitions that got a delta while a rebuild was counting
+        self._recount: Optional[set] = None
+
+    async def _count(self, match: dict) -> Dict[str, Dict[str, List[int]]]:
+        scores: Dict[str, Dict[str, List[int]]] = {}
+        cursor = db.votes.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {"competition_id": "$competition_id", "participant_id": "$participant_id"},
+                "total": {"$sum": "$rating"},
+                "count": {"$sum": 1}
+            }}
+        ])
+        async for row in cursor:
+            key = row["_id"]
+            scores.setdefault(key["competition_id"], {})[key["participant_id"]] = [row["total"], row["count"]]
+        return scores
+
+    async def rebuild(self):
+        """Count every competition's votes in MongoDB
+
+        Runs with the backplane already open. A delta that arrives meanwhile may or
+        may not be in the count, so it only marks its competition to be counted again.
+        """
+        self._recount = set()
+        try:
+            scores = await self._count({})
+            for _ in range(LEADERBOARD_RECOUNT_ROUNDS):
+                stale, self._recount = self._recount, set()
+                if not stale:
+                    break
+                recounted = await self._count({"competition_id": {"$in": sorted(stale)}})
+                for competition_id in stale:
+                    scores[competition_id] = recounted.get(competition_id, {})
+            else:
+                if self._recount:
+                    logger.warning("Leaderboards still changing after the rebuild: %s", sorted(self._recount))
+        finally:
+            self._recount = None
+        self.scores = scores
+        self.rankings = {
+            competition_id: [row["participant_id"] for row in self.results(competition_id)]
+            for competition_id in scores
+        }
+        self.loaded = True
+
+    def apply(self, competition_id: str, participant_id: str, rating: int, previous_rating: Optional[int] = None):
+        """Add a new vote, or swap an overwritten vote's old rating for its new one"""
+        score = self.scores.setdefault(competition_id, {}).setdefault(participant_id, [0, 0])
+        if previous_rating is None:
+            score[0] += rating
+            score[1] += 1
+        else:
+            score[0] += rating - previous_rating
+
+    def apply_changed(self, payload: dict):
+        competition_id = payload["competition_id"]
+        if self._recount is not None:
+            self._recount.add(competition_id)
+            return
+        self.apply(competition_id, payload["participant_id"], payload["rating"], payload.get("previous_rating"))
+        # The worker that stored the vote pushes the leaderboard; this one only remembers the order
+        self.rankings[competition_id] = [row["participant_id"] for row in self.results(competition_id)]
+
+    def results(self, competition_id: str) -> List[dict]:
+        # Same shape and ordering as leaderboard_pipeline
+        results = [
+            {
+                "participant_id": participant_id,
+                "average_rating": round(total / count, 2) if count else 0,
+                "total_votes": count
+            }
+            for participant_id, (total, count) in self.scores.get(competition_id, {}).items()
+        ]
+        results.sort(key=lambda row: (-row["average_rating"], row["participant_id"]))
+        return results
+
+    async def publish(self, competition_id: str):
+        """Push the leaderboard to the room when the ranking order changed"""
+        results = self.results(competition_id)
+        ranking = [row["participant_id"] for row in results]
+        if ranking == self.rankings.get(competition_id):
+            return
+        self.rankings[competition_id] = ranking
+        await manager.broadcast_to_room(
+            encode_event("leaderboard_update", competition_id=competition_id, results=results),
+            competition_id,
+            key=f"leaderboard_update:{competition_id}"
+        )
+
+leaderboards = LeaderboardCache()
+manager.on_control("vote_scored", leaderboards.apply_changed)
+
+# Reactions are counted in memory: a tap is one dict increment, each tick broadcasts
+# the changed counts once, and the counts are written with one $inc bulk_write per
+# REACTIONS_FLUSH_MS. Taps not yet written are lost if the process dies.
+REACTION_KINDS = {"like", "heart", "fire", "laugh", "wow", "clap"}
+# Reactions are only counted for a competition's own participants; the participant
+# lists are cached for COMPETITION_CACHE_TTL seconds and dropped on every join
+COMPETITION_CACHE_SIZE = int(os.environ.get('COMPETITION_CACHE_SIZE', '1000'))
+COMPETITION_CACHE_TTL = float(os.environ.get('COMPETITION_CACHE_TTL', '30'))
+REACTIONS_TICK_MS = int(os.environ.get('REACTIONS_TICK_MS', '250'))
+REACTIONS_FLUSH_MS = int(os.environ.get('REACTIONS_FLUSH_MS', '1000'))
+
+class ParticipantCache:
+    """LRU + TTL cache of participant ids keyed by competition id"""
+
+    def __init__(self, max_size: int = COMPETITION_CACHE_SIZE, ttl: float = COMPETITION_CACHE_TTL):
+        self.entries = LruCache(max_size, ttl)
+        self._loading = SingleFlight()
+
+    async def get(self, competition_id: str) -> Optional[frozenset]:
+        """Participant ids of the competition, or None when it does not exist"""
+        participants = self.entries.get(competition_id)
+        if participants is None:
+            participants = await self._loading.run(competition_id, lambda: self._load(competition_id))
+        return participants
+
+    async def _load(self, competition_id: str) -> Optional[frozenset]:
+        comp = await db.competitions.find_one({"id": competition_id}, {"_id": 0, "participants": 1})
+        # Unknown competitions are not cached, so made-up ids cannot fill the cache
+        if comp is None:
+            return None
+        participants = frozenset(comp["participants"])
+        self.entries.put(competition_id, participants)
+        return participants
+
+    async def ensure_competition(self, competition_id: str) -> frozenset:
+        participants = await self.get(competition_id)
+        if participants is None:
+            raise HTTPException(status_code=404, detail="Competition not found")
+        return participants
+
+    async def ensure_participant(self, competition_id: str, participant_id: str):
+        if participant_id not in await self.ensure_competition(competition_id):
+            raise HTTPException(status_code=400, detail="Not a participant of this competition")
+
+    def discard(self, competition_id: str):
+        self.entries.pop(competition_id, None)
+
+    def apply_changed(self, payload: dict):
+        self.discard(payload["competition_id"])
+
+participant_cache = ParticipantCache()
+manager.on_control("competition_joined", participant_cache.apply_changed)
+
+class ReactionCounters:
+    """Per-competition reaction counts per participant, broadcast per tick and flushed with $inc
+
+    Each worker counts its own taps; after writing them it publishes the increments
+    as a reactions_stored control message so the other workers' totals follow.
+    Every write also records the writer's flush number on the documents it
+    touched, so a worker whose load already saw a flush does not add it twice.
+    """
+
+    def __init__(self, tick_seconds: float = REACTIONS_TICK_MS / 1000, flush_seconds: float = REACTIONS_FLUSH_MS / 1000):
+        self.tick_seconds = tick_seconds
+        self.flush_seconds = flush_seconds
+        # competition_id -> (participant_id, kind) -> taps since the last tick / the last write
+        self.pending: Dict[str, Dict[tuple, int]] = {}
+        self.unflushed: Dict[str, Dict[tuple, int]] = {}
+        # competition_id -> participant_id -> kind -> total, for competitions loaded from MongoDB
+        self.totals: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # competition_id -> participant_id -> node -> last flush of that worker the loaded totals include
+        self.included: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.flushes = 0
+        self._loading = SingleFlight()
+        self._tickers: Dict[str, asyncio.Task] = {}
+
+    def add(self, competition_id: str, participant_id: str, kind: str, count: int = 1):
+        room = self.pending.get(competition_id)
+        if room is None:
+            room = self.pending[competition_id] = {}
+            if competition_id not in self._tickers:
+                self._tickers[competition_id] = asyncio.create_task(self._tick(competition_id))
+        key = (participant_id, kind)
+        room[key] = room.get(key, 0) + count
+
+    async def counts(self, competition_id: str) -> Dict[str, Dict[str, int]]:
+        """Totals per participant and kind, including taps not written yet"""
+        if competition_id not in self.totals:
+            # Concurrent readers of a cold competition share one query
+            await self._loading.run(competition_id, lambda: self._load(competition_id))
+        totals = {participant: dict(kinds) for participant, kinds in self.totals[competition_id].items()}
+        for (participant, kind), count in self.pending.get(competition_id, {}).items():
+            kinds = totals.setdefault(participant, {})
+            kinds[kind] = kinds.get(kind, 0) + count
+        return totals
+
+    async def _load(self, competition_id: str):
+        stored = await db.reactions.find(
+            {"competition_id": competition_id}, {"_id": 0, "participant_id": 1, "counts": 1, "flushed": 1}
+        ).to_list(None)
+        totals = {doc["participant_id"]: dict(doc.get("counts", {})) for doc in stored}
+        self.included[competition_id] = {doc["participant_id"]: doc.get("flushed", {}) for doc in stored}
+        # Counted taps are not in what the query returned until they are written
+        for (participant, kind), count in self.unflushed.get(competition_id, {}).items():
+            kinds = totals.setdefault(participant, {})
+            kinds[kind] = kinds.get(kind, 0) + count
+        self.totals[competition_id] = totals
+
+    def _apply(self, competition_id: str, taps: Dict[tuple, int]) -> Dict[str, Dict[str, int]]:
+        """Fold one tick of taps into the totals; returns the changed participants' totals"""
+        unflushed = self.unflushed.setdefault(competition_id, {})
+        totals = self.totals.get(competition_id)
+        changed: Dict[str, Dict[str, int]] = {}
+        for (participant, kind), count in taps.items():
+            unflushed[(participant, kind)] = unflushed.get((participant, kind), 0) + count
+            if totals is not None:
+                kinds = totals.setdefault(participant, {})
+                kinds[kind] = kinds.get(kind, 0) + count
+                changed[participant] = kinds
+        return changed
+
+    async def _tick(self, competition_id: str):
+        last_flush = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(self.tick_seconds)
+                taps = self.pending.pop(competition_id, None)
+                if taps:
+                    if competition_id not in self.totals:
+                        try:
+                            await self.counts(competition_id)
+                        except PyMongoError:
+                            # The taps are still written; totals follow once a load succeeds
+                            logger.exception("Could not load reactions for %s", competition_id)
+                    changed = self._apply(competition_id, taps)
+                    deltas: Dict[str, Dict[str, int]] = {}
+                    for (participant, kind), count in taps.items():
+                        deltas.setdefault(participant, {})[kind] = count
+                    await manager.broadcast_to_room(
+                        encode_event(
+                            "reactions_update",
+                            competition_id=competition_id,
+                            deltas=deltas,
+                            totals={participant: dict(changed[participant]) for participant in deltas if participant in changed}
+                        ),
+                        competition_id
+                    )
+                if not taps or time.monotonic() - last_flush >= self.flush_seconds:
+                    await self._flush(competition_id)
+                    last_flush = time.monotonic()
+                if competition_id not in self.pending and not self.unflushed.get(competition_id):
+                    # Idle competitions do not keep a ticker around
+                    break
+        finally:
+            self._tickers.pop(competition_id, None)
+
+    async def _flush(self, competition_id: str):
+        batch = self.unflushed.pop(competition_id, None)
+        if not batch:
+            return
+        increments: Dict[str, Dict[str, int]] = {}
+        for (participant, kind), count in batch.items():
+            increments.setdefault(participant, {})[f"counts.{kind}"] = count
+        self.flushes += 1
+        flush = self.flushes
+        try:
+            await db.reactions.bulk_write([
+                UpdateOne(
+                    {"competition_id": competition_id, "participant_id": participant},
+                    {"$inc": inc, "$max": {f"flushed.{manager.node_id}": flush}},
+                    upsert=True
+                )
+                for participant, inc in increments.items()
+            ], ordered=False)
+        except PyMongoError:
+            logger.exception("Could not store reactions for %s; retrying with the next flush", competition_id)
+            retry = self.unflushed.setdefault(competition_id, {})
+            for key, count in batch.items():
+                retry[key] = retry.get(key, 0) + count
+            return
+        stored: Dict[str, Dict[str, int]] = {}
+        for (participant, kind), count in batch.items():
+            stored.setdefault(participant, {})[kind] = count
+        await manager.publish_control("reactions_stored", competition_id=competition_id, flush=flush, counts=stored)
+
+    def apply_stored(self, payload: dict):
+        # Competitions this worker has not loaded pick the taps up from MongoDB when they are
+        competition_id = payload["competition_id"]
+        totals = self.totals.get(competition_id)
+        if totals is None:
+            return
+        included = self.included.get(competition_id, {})
+        for participant, counts in payload["counts"].items():
+            if included.get(participant, {}).get(payload["node"], 0) >= payload["flush"]:
+                # The load ran after this write landed
+                continue
+            kinds = totals.setdefault(participant, {})
+            for kind, count in counts.items():
+                kinds[kind] = kinds.get(kind, 0) + count
+
+    async def close(self):
+        """Stop the tickers and write every tap counted so far"""
+        for ticker in list(self._tickers.values()):
+            ticker.cancel()
+        self._tickers.clear()
+        for competition_id, taps in list(self.pending.items()):
+            self._apply(competition_id, taps)
+        self.pending.clear()
+        for competition_id in list(self.unflushed):
+            await self._flush(competition_id)
+
+    def discard(self, competition_id: str):
+        self.totals.pop(competition_id, None)
+        self.included.pop(competition_id, None)
+
+reactions = ReactionCounters()
+manager.on_control("reactions_stored", reactions.apply_stored)
 
 # Models
 class User(BaseModel):
@@ -97,6 +1192,7 @@ class Competition(BaseModel):
     moderator_id: str
     voting_enabled: bool = False
     voting_type: str = "stars"  # stars, thumbs, custom
+    voting_tick_ms: int = VOTING_TICK_MS  # live voting broadcast interval
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -110,6 +1206,9 @@ class Vote(BaseModel):
     rating: int = 5  # 1-5 for stars, 1 for thumbs up, -1 for thumbs down
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class VoteResult(Vote):
+    is_new: bool  # False when the voter's earlier vote was overwritten
+
 class LiveVotingSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     competition_id: str
@@ -117,9 +1216,14 @@ class LiveVotingSession(BaseModel):
     options: List[str] = []
     is_active: bool = True
     votes: Dict[str, int] = {}  # option -> count
-    voter_ids: List[str] = []  # Track who voted
+    voter_ids: List[str] = []  # Legacy; voters are now tracked in live_voting_ballots
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+def utcnow_ms() -> datetime:
+    """The current UTC time at the millisecond precision MongoDB stores"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
 class ChatMessage(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     competition_id: str
@@ -127,7 +1231,8 @@ class ChatMessage(BaseModel):
     username: str
     message: str
     is_moderated: bool = False
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    # Page cursors are built from messages still in memory, so they must match what is stored
+    timestamp: datetime = Field(default_factory=utcnow_ms)
 
 class AdminAction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -137,6 +1242,14 @@ class AdminAction(BaseModel):
     details: Dict = {}
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class ModerationRule(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    pattern: str  # a word or phrase, or a regular expression when is_regex is set
+    is_regex: bool = False
+    action: str = "mask"  # mask, block
+    created_by: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Create requests
 class UserCreate(BaseModel):
     username: str
@@ -149,6 +1262,7 @@ class CompetitionCreate(BaseModel):
     description: str
     moderator_id: str
     voting_enabled: bool = False
+    voting_tick_ms: int = Field(VOTING_TICK_MS, ge=50, le=5000)
 
 class VoteCreate(BaseModel):
     competition_id: str
@@ -173,6 +1287,468 @@ class MessageCreate(BaseModel):
     username: str
     message: str
 
+class ReactionCreate(BaseModel):
+    competition_id: str
+    participant_id: str
+    user_id: str
+    kind: str = "like"
+    count: int = Field(1, ge=1, le=50)  # clients may batch a burst of taps
+
+class ModerationRuleCreate(BaseModel):
+    pattern: str = Field(..., min_length=1, max_length=200)
+    is_regex: bool = False
+    action: str = Field("mask", pattern="^(mask|block)$")
+
+# Chat write-behind buffer
+# Durability: a message is acknowledged as soon as it is buffered. It is written
+# with insert_many and then broadcast to the room at the next flush, at most
+# CHAT_FLUSH_MS later, so viewers never see a message that was not stored. A
+# failed batch is retried on the following flushes, up to CHAT_FLUSH_RETRIES
+# times per message. A graceful shutdown flushes everything still buffered and
+# refuses new messages; a crash loses at most the last flush interval.
+CHAT_FLUSH_SIZE = int(os.environ.get('CHAT_FLUSH_SIZE', '100'))
+CHAT_FLUSH_MS = int(os.environ.get('CHAT_FLUSH_MS', '100'))
+CHAT_FLUSH_RETRIES = int(os.environ.get('CHAT_FLUSH_RETRIES', '3'))
+CHAT_BATCH_MAX = 500
+
+class ChatIngestBuffer:
+    """Buffers chat per competition and flushes it as one insert_many and one new_messages frame"""
+
+    def __init__(
+        self,
+        flush_size: int = CHAT_FLUSH_SIZE,
+        flush_seconds: float = CHAT_FLUSH_MS / 1000,
+        max_retries: int = CHAT_FLUSH_RETRIES
+    ):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.pending: Dict[str, List[ChatMessage]] = {}
+        self.closed = False
+        self.flushed = 0
+        self.dropped = 0
+        self._attempts: Dict[str, int] = {}
+        self._full: Dict[str, asyncio.Event] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+
+    def add(self, message: ChatMessage):
+        if self.closed:
+            raise HTTPException(status_code=503, detail="Chat is shutting down")
+        competition_id = message.competition_id
+        batch = self.pending.setdefault(competition_id, [])
+        batch.append(message)
+        if competition_id not in self._flushers:
+            self._full[competition_id] = asyncio.Event()
+            self._flushers[competition_id] = asyncio.create_task(self._run(competition_id))
+        if len(batch) >= self.flush_size:
+            self._full[competition_id].set()
+
+    async def _run(self, competition_id: str):
+        full = self._full[competition_id]
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(full.wait(), timeout=self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                full.clear()
+                await self._flush(competition_id)
+                if not self.pending.get(competition_id):
+                    # Quiet competitions do not keep a flusher around
+                    break
+                if self.closed or len(self.pending[competition_id]) >= self.flush_size:
+                    full.set()
+        finally:
+            self._flushers.pop(competition_id, None)
+            self._full.pop(competition_id, None)
+
+    async def _flush(self, competition_id: str):
+        batch = self.pending.pop(competition_id, [])[:]
+        if not batch:
+            return
+        failed: List[ChatMessage] = []
+        try:
+            await db.messages.insert_many([message.dict() for message in batch], ordered=False)
+        except BulkWriteError as exc:
+            # Duplicate ids were stored by an earlier attempt, so they count as written
+            failed_indexes = {error["index"] for error in exc.details.get("writeErrors", []) if error.get("code") != 11000}
+            failed = [message for index, message in enumerate(batch) if index in failed_indexes]
+        except PyMongoError:
+            logger.exception("Could not store %d chat messages for %s", len(batch), competition_id)
+            failed = batch
+        stored = batch
+        if failed:
+            self._retry_later(competition_id, failed)
+            failed_ids = {message.id for message in failed}
+            stored = [message for message in batch if message.id not in failed_ids]
+        for message in stored:
+            self._attempts.pop(message.id, None)
+        if stored:
+            self.flushed += len(stored)
+            admin_stats.adjust("total_messages", len(stored))
+            recent_chat.add(competition_id, stored)
+            await manager.broadcast_to_room(
+                encode_event("new_messages", competition_id=competition_id, messages=stored),
+                competition_id
+            )
+            await manager.publish_control("chat_stored", competition_id=competition_id, messages=stored)
+
+    def _retry_later(self, competition_id: str, messages: List[ChatMessage]):
+        retry = []
+        for message in messages:
+            attempts = self._attempts.get(message.id, 0) + 1
+            if attempts > self.max_retries:
+                logger.error("Dropping chat message %s after %d failed writes", message.id, attempts)
+                self._attempts.pop(message.id, None)
+                self.dropped += 1
+            else:
+                self._attempts[message.id] = attempts
+                retry.append(message)
+        if retry:
+            self.pending[competition_id] = retry + self.pending.get(competition_id, [])
+
+    async def close(self):
+        """Refuse new messages and flush everything still buffered"""
+        self.closed = True
+        for event in self._full.values():
+            event.set()
+        await asyncio.gather(*self._flushers.values(), return_exceptions=True)
+
+chat_ingest = ChatIngestBuffer()
+
+# Recent chat is kept in memory so viewer joins do not query MongoDB; only the
+# CHAT_HISTORY_ROOMS most recently used competitions keep a buffer
+CHAT_HISTORY_SIZE = int(os.environ.get('CHAT_HISTORY_SIZE', '200'))
+CHAT_HISTORY_ROOMS = int(os.environ.get('CHAT_HISTORY_ROOMS', '1000'))
+
+class ChatTail:
+    """The last stored messages of one competition, in (timestamp, id) order"""
+
+    def __init__(self, messages=()):
+        self.messages: Deque[ChatMessage] = deque(messages)
+        self.ids = {message.id for message in self.messages}
+        # Merged with MongoDB, so it holds the true tail rather than just what this worker saw
+        self.complete = False
+
+class RecentChat:
+    """Ring buffer of the last stored messages of each recently used competition"""
+
+    def __init__(self, size: int = CHAT_HISTORY_SIZE, max_rooms: int = CHAT_HISTORY_ROOMS):
+        self.size = size
+        self.rooms = LruCache(max_rooms)
+        self._loading = SingleFlight()
+
+    def add(self, competition_id: str, messages: List[ChatMessage]):
+        tail = self.rooms.get(competition_id)
+        if tail is None:
+            tail = ChatTail()
+            self.rooms.put(competition_id, tail)
+        room, ids = tail.messages, tail.ids
+        for message in messages:
+            if message.id in ids:
+                continue
+            # Kept in (timestamp, id) order, the order pages are read from MongoDB in;
+            # messages nearly always arrive at or near the end
+            key = (message.timestamp, message.id)
+            index = len(room)
+            while index and (room[index - 1].timestamp, room[index - 1].id) > key:
+                index -= 1
+            if len(room) >= self.size:
+                if index == 0:
+                    continue
+                ids.discard(room.popleft().id)
+                index -= 1
+            room.insert(index, message)
+            ids.add(message.id)
+
+    def moderate(self, competition_id: str, message_id: str):
+        tail = self.rooms.get(competition_id)
+        for message in tail.messages if tail is not None else ():
+            if message.id == message_id:
+                message.is_moderated = True
+                return
+
+    async def latest(self, competition_id: str, limit: int) -> List[ChatMessage]:
+        """The newest messages in chronological order; MongoDB is read at most once per buffered room"""
+        tail = self.rooms.get(competition_id)
+        if tail is None or not tail.complete:
+            # Concurrent joins of a cold room share one query
+            tail = await self._loading.run(competition_id, lambda: self._load(competition_id))
+        if tail is None or limit <= 0:
+            return []
+        return list(tail.messages)[-limit:]
+
+    async def _load(self, competition_id: str) -> Optional[ChatTail]:
+        stored = await db.messages.find(
+            {"competition_id": competition_id}, WITHOUT_OBJECT_ID
+        ).sort([("timestamp", DESCENDING), ("id", DESCENDING)]).limit(self.size).to_list(self.size)
+        # Messages stored while the query ran are already buffered; merge and keep the newest
+        merged = {doc["id"]: ChatMessage(**doc) for doc in stored}
+        buffered = self.rooms.get(competition_id)
+        for message in buffered.messages if buffered is not None else ():
+            merged[message.id] = message
+        if not merged:
+            # Nothing to keep; unknown and silent competitions do not take a buffer
+            return None
+        tail = ChatTail(sorted(merged.values(), key=lambda message: (message.timestamp, message.id))[-self.size:])
+        tail.complete = True
+        self.rooms.put(competition_id, tail)
+        return tail
+
+    def discard(self, competition_id: str):
+        self.rooms.pop(competition_id)
+
+    def apply_stored(self, payload: dict):
+        self.add(payload["competition_id"], [ChatMessage(**message) for message in payload["messages"]])
+
+    def apply_moderated(self, payload: dict):
+        self.moderate(payload["competition_id"], payload["message_id"])
+
+recent_chat = RecentChat()
+manager.on_control("chat_stored", recent_chat.apply_stored)
+manager.on_control("chat_moderated", recent_chat.apply_moderated)
+
+# Chat moderation filter, applied to every message before it is buffered or relayed
+WORD_RE = re.compile(r"\w+")
+# Escapes, inline global flags like (?i), backreferences and named groups in a regex rule
+REGEX_RULE_TOKEN_RE = re.compile(r"\\(.)|\(\?[aiLmsux]+\)|\(\?P[=<]", re.DOTALL)
+
+def regex_rule_error(pattern: str) -> Optional[str]:
+    """Why a regex rule cannot join the combined alternation, or None when it can
+
+    Regex rules are matched as one big (?:rule)|(?:rule) pattern, so a rule may
+    not set global flags, refer to its own groups by number or name, or name a
+    group another rule could also name.
+    """
+    try:
+        re.compile(pattern)
+    except re.error as exc:
+        return f"Invalid pattern: {exc}"
+    for match in REGEX_RULE_TOKEN_RE.finditer(pattern):
+        escaped = match.group(1)
+        if escaped is None:
+            if match.group().startswith("(?P"):
+                return "Named groups and backreferences are not supported"
+            return "Inline global flags are not supported; rules already ignore case"
+        if escaped in "123456789":
+            return "Backreferences are not supported"
+    return None
+
+class ModerationFilter:
+    """Precompiled matcher for the moderation rules.
+
+    Single-word rules are a set lookup per word of the message. Phrases are
+    folded into one alternation per action that only runs when the message
+    contains the first word of some phrase, and regex rules into one more.
+    A clean message therefore costs one tokenising pass and two set checks.
+    """
+
+    def __init__(self, rules: List[ModerationRule] = ()):
+        self.load(rules)
+
+    def load(self, rules: List[ModerationRule]):
+        words = {"block": set(), "mask": set()}
+        phrase_heads = set()
+        patterns = {"block": [], "mask": []}
+        loaded = []
+        for rule in rules:
+            if rule.is_regex:
+                error = regex_rule_error(rule.pattern)
+                if error is not None:
+                    logger.warning("Skipping moderation rule %s: %s", rule.id, error)
+                    continue
+                patterns[rule.action].append(f"(?:{rule.pattern})")
+                loaded.append(rule)
+                continue
+            loaded.append(rule)
+            tokens = WORD_RE.findall(rule.pattern.casefold())
+            if len(tokens) == 1 and tokens[0] == rule.pattern.casefold().strip():
+                words[rule.action].add(tokens[0])
+            elif tokens:
+                phrase_heads.add(tokens[0])
+                patterns[rule.action].append(r"\b" + r"\W+".join(map(re.escape, tokens)) + r"\b")
+        self.block_words = frozenset(words["block"])
+        self.mask_words = frozenset(words["mask"])
+        self.phrase_heads = frozenset(phrase_heads)
+        self.has_regex = any(rule.is_regex for rule in loaded)
+        self.block_re = re.compile("|".join(patterns["block"]), re.IGNORECASE) if patterns["block"] else None
+        self.mask_re = re.compile("|".join(patterns["mask"]), re.IGNORECASE) if patterns["mask"] else None
+        self.rule_count = len(loaded)
+
+    def check(self, text: str):
+        """Return (blocked, text with masked matches starred out)"""
+        tokens = set(WORD_RE.findall(text.casefold()))
+        run_patterns = self.has_regex or not self.phrase_heads.isdisjoint(tokens)
+        if not self.block_words.isdisjoint(tokens):
+            return True, text
+        if run_patterns and self.block_re is not None and self.block_re.search(text):
+            return True, text
+        if not self.mask_words.isdisjoint(tokens):
+            mask_words = self.mask_words
+            text = WORD_RE.sub(
+                lambda match: "*" * len(match.group()) if match.group().casefold() in mask_words else match.group(),
+                text
+            )
+        if run_patterns and self.mask_re is not None:
+            text = self.mask_re.sub(lambda match: "*" * len(match.group()), text)
+        return False, text
+
+    async def reload(self):
+        rules = await db.moderation_rules.find({}, WITHOUT_OBJECT_ID).to_list(None)
+        self.load([ModerationRule(**rule) for rule in rules])
+        logger.info("Loaded %d chat moderation rules", self.rule_count)
+
+    def apply_changed(self, payload: dict):
+        asyncio.create_task(self.reload())
+
+moderation = ModerationFilter()
+manager.on_control("moderation_rules_changed", moderation.apply_changed)
+
+def screen_message(input: MessageCreate) -> Optional[ChatMessage]:
+    """The chat message to store, or None when a block rule matched"""
+    blocked, text = moderation.check(input.message)
+    if blocked:
+        return None
+    if text == input.message:
+        return ChatMessage(**input.dict())
+    return ChatMessage(**{**input.dict(), "message": text, "is_moderated": True})
+
+# The admin dashboard reads a snapshot instead of counting on every refresh: write
+# handlers on this worker adjust it as they go, and a background refresh every
+# ADMIN_STATS_REFRESH_MS reconciles it with what every worker has written
+ADMIN_STATS_REFRESH_MS = int(os.environ.get('ADMIN_STATS_REFRESH_MS', '5000'))
+
+class AdminStats:
+    """Dashboard counters, refreshed in the background and adjusted by write handlers"""
+
+    def __init__(self, refresh_seconds: float = ADMIN_STATS_REFRESH_MS / 1000):
+        self.refresh_seconds = refresh_seconds
+        self.counts: Dict[str, int] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        # Whole-collection totals come from collection metadata; only the filtered
+        # counts touch an index, and all five run at once
+        total_users, total_votes, total_messages, active_competitions, banned_users = await asyncio.gather(
+            db.users.estimated_document_count(),
+            db.votes.estimated_document_count(),
+            db.messages.estimated_document_count(),
+            db.competitions.count_documents({"status": "active"}),
+            db.users.count_documents({"is_banned": True})
+        )
+        self.counts = {
+            "total_users": total_users,
+            "active_competitions": active_competitions,
+            "total_votes": total_votes,
+            "total_messages": total_messages,
+            "banned_users": banned_users
+        }
+
+    def adjust(self, name: str, delta: int = 1):
+        if name in self.counts:
+            self.counts[name] += delta
+
+    async def snapshot(self) -> Dict[str, int]:
+        if not self.counts:
+            await self.refresh()
+        return dict(self.counts)
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except PyMongoError:
+                logger.exception("Could not refresh admin stats")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+admin_stats = AdminStats()
+
+# Keyset pagination for list endpoints, ordered by (created_at, id)
+MAX_PAGE_SIZE = 1000
+PAGE_SORT = [("created_at", ASCENDING), ("id", ASCENDING)]
+
+def encode_page_cursor(doc: dict, field: str = "created_at") -> str:
+    key = safe_json_dumps([doc[field], doc["id"]])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def keyset_filter(cursor: Optional[str], field: str = "created_at", op: str = "$gt") -> dict:
+    """Query for the documents that sort after (or, with $lt, before) an opaque page cursor"""
+    if not cursor:
+        return {}
+    try:
+        value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "id": {op: doc_id}}
+    ]}
+
+# Reads never need Mongo's _id; a fields= list narrows the projection further and
+# skips response-model validation for the partial documents
+WITHOUT_OBJECT_ID = {"_id": 0}
+
+def field_projection(model, fields: Optional[str]) -> Optional[dict]:
+    """Projection for a comma-separated fields= parameter, or None for full documents"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in model.model_fields]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return {"_id": 0, **{field: 1 for field in requested}}
+
+def lean_response(data, headers: Optional[Dict[str, str]] = None) -> Response:
+    # Headers go on this response; ones set on an injected Response are dropped when we return our own
+    return Response(content=safe_json_dumps(data), media_type="application/json", headers=headers)
+
+async def stream_ndjson(cursor):
+    async for doc in cursor:
+        yield safe_json_dumps(doc) + "\n"
+
+async def list_page(
+    collection,
+    model,
+    response: Response,
+    limit: Optional[int],
+    after: Optional[str],
+    format: str,
+    fields: Optional[str] = None
+):
+    """One keyset page of a collection, or the whole rest of it as NDJSON"""
+    projection = field_projection(model, fields)
+    if format == "ndjson":
+        # Exports stream documents as the driver yields them instead of buffering a list
+        cursor = collection.find(keyset_filter(after), projection or WITHOUT_OBJECT_ID).sort(PAGE_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(stream_ndjson(cursor.batch_size(500)), media_type="application/x-ndjson")
+    if projection is None:
+        cursor = collection.find(keyset_filter(after), WITHOUT_OBJECT_ID)
+    else:
+        # The page cursor is built from these even when they were not asked for
+        cursor = collection.find(keyset_filter(after), {**projection, "created_at": 1, "id": 1})
+    limit = limit or MAX_PAGE_SIZE
+    docs = await cursor.sort(PAGE_SORT).limit(limit).to_list(limit)
+    headers = {}
+    if len(docs) == limit:
+        headers["X-Next-Cursor"] = encode_page_cursor(docs[-1])
+    if projection is None:
+        response.headers.update(headers)
+        return [model(**doc) for doc in docs]
+    page = [{field: doc[field] for field in projection if field in doc} for doc in docs]
+    return lean_response(page, headers)
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -183,18 +1759,47 @@ async def root():
 async def create_user(input: UserCreate):
     user = User(**input.dict())
     await db.users.insert_one(user.dict())
+    admin_stats.adjust("total_users")
     return user
 
 @api_router.get("/users", response_model=List[User])
-async def get_users():
-    users = await db.users.find().to_list(1000)
-    return [User(**user) for user in users]
+async def get_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    fields: Optional[str] = None,
+    ids: Optional[str] = None
+):
+    if ids is not None:
+        return await get_users_by_id(ids, fields)
+    return await list_page(db.users, User, response, limit, after, format, fields)
+
+def project_user(user: dict, projection: Optional[dict]):
+    if projection is None:
+        return User(**user)
+    return {field: user[field] for field in projection if field in user and field != "_id"}
+
+async def get_users_by_id(ids: str, fields: Optional[str]):
+    """Users for a comma-separated ids= list, in the order asked for; unknown ids are left out"""
+    user_ids = [user_id.strip() for user_id in ids.split(",") if user_id.strip()]
+    if len(user_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+    projection = field_projection(User, fields)
+    users = await user_cache.get_many(user_ids)
+    found = [project_user(users[user_id], projection) for user_id in dict.fromkeys(user_ids) if user_id in users]
+    if projection:
+        return lean_response(found)
+    return found
 
 @api_router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id})
+async def get_user(user_id: str, fields: Optional[str] = None):
+    projection = field_projection(User, fields)
+    user = await user_cache.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if projection:
+        return lean_response(project_user(user, projection))
     return User(**user)
 
 @api_router.post("/users/{user_id}/ban")
@@ -202,6 +1807,9 @@ async def ban_user(user_id: str, admin_id: str):
     result = await db.users.update_one({"id": user_id}, {"$set": {"is_banned": True}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    bans.set_banned(user_id, True)
+    admin_stats.adjust("banned_users")
+    await manager.publish_control("user_ban_changed", user_id=user_id, banned=True)
     
     # Log admin action
     action = AdminAction(admin_id=admin_id, action_type="ban_user", target_id=user_id)
@@ -214,6 +1822,9 @@ async def unban_user(user_id: str, admin_id: str):
     result = await db.users.update_one({"id": user_id}, {"$set": {"is_banned": False}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    bans.set_banned(user_id, False)
+    admin_stats.adjust("banned_users", -1)
+    await manager.publish_control("user_ban_changed", user_id=user_id, banned=False)
     
     # Log admin action
     action = AdminAction(admin_id=admin_id, action_type="unban_user", target_id=user_id)
@@ -229,47 +1840,82 @@ async def create_competition(input: CompetitionCreate):
     return competition
 
 @api_router.get("/competitions", response_model=List[Competition])
-async def get_competitions():
-    competitions = await db.competitions.find().to_list(1000)
-    return [Competition(**comp) for comp in competitions]
+async def get_competitions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    fields: Optional[str] = None
+):
+    return await list_page(db.competitions, Competition, response, limit, after, format, fields)
 
 @api_router.get("/competitions/{competition_id}", response_model=Competition)
-async def get_competition(competition_id: str):
-    comp = await db.competitions.find_one({"id": competition_id})
+async def get_competition(competition_id: str, fields: Optional[str] = None):
+    projection = field_projection(Competition, fields)
+    comp = await db.competitions.find_one({"id": competition_id}, projection or WITHOUT_OBJECT_ID)
     if not comp:
         raise HTTPException(status_code=404, detail="Competition not found")
+    if projection:
+        return lean_response(comp)
     return Competition(**comp)
 
 @api_router.post("/competitions/{competition_id}/join")
 async def join_competition(competition_id: str, user_id: str):
-    comp = await db.competitions.find_one({"id": competition_id})
-    if not comp:
-        raise HTTPException(status_code=404, detail="Competition not found")
-    
-    competition = Competition(**comp)
-    if len(competition.participants) >= competition.max_participants:
-        raise HTTPException(status_code=400, detail="Competition is full")
-    
-    if user_id not in competition.participants:
-        competition.participants.append(user_id)
-        await db.competitions.replace_one({"id": competition_id}, competition.dict())
+    bans.ensure_allowed(user_id)
+    # The capacity check and the join are one conditional update, so concurrent
+    # joins can neither overfill the competition nor overwrite each other
+    comp = await db.competitions.find_one_and_update(
+        {
+            "id": competition_id,
+            "participants": {"$ne": user_id},
+            "$expr": {"$lt": [{"$size": "$participants"}, "$max_participants"]}
+        },
+        {"$addToSet": {"participants": user_id}},
+        projection={"_id": 0, "participants": 1, "max_participants": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if comp is None:
+        # Nothing matched: find out which condition failed
+        comp = await db.competitions.find_one(
+            {"id": competition_id}, {"_id": 0, "participants": 1, "max_participants": 1}
+        )
+        if not comp:
+            raise HTTPException(status_code=404, detail="Competition not found")
+        if user_id not in comp["participants"]:
+            raise HTTPException(status_code=400, detail="Competition is full")
+    else:
+        participant_cache.discard(competition_id)
+        await manager.publish_control("competition_joined", competition_id=competition_id)
     
-    return {"message": "Successfully joined competition"}
+    return {
+        "message": "Successfully joined competition",
+        "participant_count": len(comp["participants"]),
+        "max_participants": comp["max_participants"]
+    }
+
+# Competitions move waiting -> active -> ended; each target status lists the one it may follow
+COMPETITION_TRANSITIONS = {"active": "waiting", "ended": "active"}
+
+async def transition_competition(competition_id: str, status: str, timestamp_field: str):
+    """Move a competition to status with a $set guarded by its current status"""
+    result = await db.competitions.update_one(
+        {"id": competition_id, "status": COMPETITION_TRANSITIONS[status]},
+        {"$set": {"status": status, timestamp_field: datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        comp = await db.competitions.find_one({"id": competition_id}, {"_id": 0, "status": 1})
+        if not comp:
+            raise HTTPException(status_code=404, detail="Competition not found")
+        raise HTTPException(status_code=409, detail=f"Competition is {comp['status']}")
 
 @api_router.post("/competitions/{competition_id}/start")
 async def start_competition(competition_id: str):
-    comp = await db.competitions.find_one({"id": competition_id})
-    if not comp:
-        raise HTTPException(status_code=404, detail="Competition not found")
-    
-    competition = Competition(**comp)
-    competition.status = "active"
-    competition.start_time = datetime.utcnow()
-    await db.competitions.replace_one({"id": competition_id}, competition.dict())
+    await transition_competition(competition_id, "active", "start_time")
+    admin_stats.adjust("active_competitions")
     
     # Broadcast to room
     await manager.broadcast_to_room(
-        safe_json_dumps({"type": "competition_started", "competition_id": competition_id}),
+        encode_event("competition_started", competition_id=competition_id),
         competition_id
     )
     
@@ -277,32 +1923,39 @@ async def start_competition(competition_id: str):
 
 @api_router.post("/competitions/{competition_id}/end")
 async def end_competition(competition_id: str):
-    comp = await db.competitions.find_one({"id": competition_id})
-    if not comp:
-        raise HTTPException(status_code=404, detail="Competition not found")
-    
-    competition = Competition(**comp)
-    competition.status = "ended"
-    competition.end_time = datetime.utcnow()
-    await db.competitions.replace_one({"id": competition_id}, competition.dict())
-    
-    # End all active voting sessions
-    await db.live_voting.update_many(
-        {"competition_id": competition_id}, 
-        {"$set": {"is_active": False}}
-    )
+    await transition_competition(competition_id, "ended", "end_time")
+    admin_stats.adjust("active_competitions", -1)
     
-    # Broadcast to room
-    await manager.broadcast_to_room(
-        safe_json_dumps({"type": "competition_ended", "competition_id": competition_id}),
-        competition_id
+    # End all active voting sessions while the room hears about it
+    await asyncio.gather(
+        db.live_voting.update_many(
+            {"competition_id": competition_id, "is_active": True},
+            {"$set": {"is_active": False}}
+        ),
+        manager.broadcast_to_room(
+            encode_event("competition_ended", competition_id=competition_id),
+            competition_id
+        )
     )
+    # Ended competitions do not need their chat tail, event log, snapshot or reaction totals in memory any more
+    recent_chat.discard(competition_id)
+    manager.discard_event_log(competition_id)
+    room_snapshots.discard(competition_id)
+    reactions.discard(competition_id)
     
     return {"message": "Competition ended"}
 
 # Live Voting System
+def vote_option_path(option: str) -> str:
+    """Dotted path of an option's counter inside a voting session document"""
+    if not option or "." in option or option.startswith("$"):
+        raise HTTPException(status_code=400, detail="Invalid voting option")
+    return f"votes.{option}"
+
 @api_router.post("/voting/create", response_model=LiveVotingSession)
 async def create_voting_session(input: LiveVotingCreate):
+    for option in input.options:
+        vote_option_path(option)
     voting_session = LiveVotingSession(**input.dict())
     # Initialize votes for each option
     voting_session.votes = {option: 0 for option in input.options}
@@ -310,10 +1963,7 @@ async def create_voting_session(input: LiveVotingCreate):
     
     # Broadcast to all clients in the competition
     await manager.broadcast_to_room(
-        safe_json_dumps({
-            "type": "voting_started",
-            "voting_session": voting_session.dict()
-        }),
+        encode_event("voting_started", voting_session=voting_session),
         input.competition_id
     )
     
@@ -321,38 +1971,57 @@ async def create_voting_session(input: LiveVotingCreate):
 
 @api_router.post("/voting/submit")
 async def submit_live_vote(input: LiveVoteSubmit):
-    session = await db.live_voting.find_one({"id": input.voting_session_id})
-    if not session:
-        raise HTTPException(status_code=404, detail="Voting session not found")
-    
-    voting_session = LiveVotingSession(**session)
+    bans.ensure_allowed(input.voter_id)
+    option_path = vote_option_path(input.selected_option)
+    ballot = {"voting_session_id": input.voting_session_id, "voter_id": input.voter_id}
     
-    if not voting_session.is_active:
-        raise HTTPException(status_code=400, detail="Voting session is not active")
-    
-    # Check if user already voted
-    if input.voter_id in voting_session.voter_ids:
+    # Claim the voter's ballot; the unique index makes this the double-vote check
+    try:
+        await db.live_voting_ballots.insert_one({
+            **ballot,
+            "selected_option": input.selected_option,
+            "timestamp": datetime.utcnow()
+        })
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="User has already voted")
     
-    # Update vote count
-    if input.selected_option in voting_session.votes:
-        voting_session.votes[input.selected_option] += 1
-        voting_session.voter_ids.append(input.voter_id)
-        
-        await db.live_voting.replace_one({"id": input.voting_session_id}, voting_session.dict())
-        
-        # Broadcast updated results
-        await manager.broadcast_to_room(
-            safe_json_dumps({
-                "type": "voting_update",
-                "voting_session": voting_session.dict()
-            }),
-            voting_session.competition_id
+    # Count the vote in a single conditional update; voter_ids is only checked
+    # for sessions created before ballots existed
+    session = await db.live_voting.find_one_and_update(
+        {
+            "id": input.voting_session_id,
+            "is_active": True,
+            option_path: {"$exists": True},
+            "voter_ids": {"$ne": input.voter_id}
+        },
+        {"$inc": {option_path: 1}},
+        projection={"_id": 0, "competition_id": 1, option_path: 1},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if session is None:
+        await db.live_voting_ballots.delete_one(ballot)
+        session = await db.live_voting.find_one(
+            {"id": input.voting_session_id},
+            {"_id": 0, "is_active": 1, "votes": 1, "voter_ids": {"$elemMatch": {"$eq": input.voter_id}}}
         )
-        
-        return {"message": "Vote submitted successfully"}
-    else:
+        if not session:
+            raise HTTPException(status_code=404, detail="Voting session not found")
+        if not session.get("is_active"):
+            raise HTTPException(status_code=400, detail="Voting session is not active")
+        if session.get("voter_ids"):
+            raise HTTPException(status_code=400, detail="User has already voted")
         raise HTTPException(status_code=400, detail="Invalid voting option")
+    
+    # The aggregator broadcasts the new count with the next tick
+    await voting_tallies.record(
+        session["competition_id"],
+        input.voting_session_id,
+        input.selected_option,
+        session["votes"][input.selected_option]
+    )
+    
+    return {"message": "Vote submitted successfully"}
 
 @api_router.post("/voting/{session_id}/end")
 async def end_voting_session(session_id: str):
@@ -363,119 +2032,193 @@ async def end_voting_session(session_id: str):
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Voting session not found")
     
-    session = await db.live_voting.find_one({"id": session_id})
+    session = await db.live_voting.find_one({"id": session_id}, {"_id": 0, "voter_ids": 0})
     voting_session = LiveVotingSession(**session)
     
     # Broadcast voting ended
     await manager.broadcast_to_room(
-        safe_json_dumps({
-            "type": "voting_ended",
-            "voting_session": voting_session.dict()
-        }),
+        encode_event("voting_ended", voting_session=voting_session),
         voting_session.competition_id
     )
     
     return {"message": "Voting session ended"}
 
+async def get_voting_snapshot(competition_id: str) -> List[dict]:
+    """Full tallies of a competition's active voting sessions, without the voter list"""
+    sessions = await db.live_voting.find(
+        {"competition_id": competition_id, "is_active": True},
+        {"_id": 0, "voter_ids": 0}
+    ).to_list(100)
+    return [LiveVotingSession(**session).dict(exclude={"voter_ids"}) for session in sessions]
+
 @api_router.get("/voting/active/{competition_id}")
-async def get_active_voting_sessions(competition_id: str):
+async def get_active_voting_sessions(competition_id: str, fields: Optional[str] = None):
+    projection = field_projection(LiveVotingSession, fields)
     sessions = await db.live_voting.find({
         "competition_id": competition_id,
         "is_active": True
-    }).to_list(100)
+    }, projection or WITHOUT_OBJECT_ID).to_list(100)
+    if projection:
+        return lean_response(sessions)
     return [LiveVotingSession(**session) for session in sessions]
 
 @api_router.get("/voting/{session_id}", response_model=LiveVotingSession)
 async def get_voting_session(session_id: str):
-    session = await db.live_voting.find_one({"id": session_id})
+    session = await db.live_voting.find_one({"id": session_id}, WITHOUT_OBJECT_ID)
     if not session:
         raise HTTPException(status_code=404, detail="Voting session not found")
     return LiveVotingSession(**session)
 
 # Traditional voting system (stars)
-@api_router.post("/votes", response_model=Vote)
+@api_router.post("/votes", response_model=VoteResult)
 async def cast_vote(input: VoteCreate):
-    # Check if user already voted for this participant
-    existing_vote = await db.votes.find_one({
+    bans.ensure_allowed(input.voter_id)
+    vote = Vote(**input.dict())
+    # One vote per voter per participant: the unique index on this key makes the
+    # upsert either overwrite the existing vote or create it, in one round trip
+    key = {
         "competition_id": input.competition_id,
         "participant_id": input.participant_id,
         "voter_id": input.voter_id
-    })
-    
-    if existing_vote:
-        # Update existing vote
-        await db.votes.update_one(
-            {"id": existing_vote["id"]},
-            {"$set": {"rating": input.rating, "vote_type": input.vote_type}}
+    }
+    update = {
+        "$set": {"rating": input.rating, "vote_type": input.vote_type},
+        "$setOnInsert": {"id": vote.id, "timestamp": vote.timestamp}
+    }
+    try:
+        existing_vote = await db.votes.find_one_and_update(
+            key, update, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.BEFORE
         )
-        vote = Vote(**{**existing_vote, "rating": input.rating, "vote_type": input.vote_type})
+    except DuplicateKeyError:
+        # A concurrent first vote won the insert; this one now overwrites it
+        existing_vote = await db.votes.find_one_and_update(
+            key, update, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    
+    is_new = existing_vote is None
+    previous_rating = None
+    if is_new:
+        admin_stats.adjust("total_votes")
     else:
-        # Create new vote
-        vote = Vote(**input.dict())
-        await db.votes.insert_one(vote.dict())
+        vote = Vote(**{**existing_vote, "rating": input.rating, "vote_type": input.vote_type})
+        previous_rating = existing_vote["rating"]
+    leaderboards.apply(input.competition_id, input.participant_id, input.rating, previous_rating)
+    await manager.publish_control(
+        "vote_scored",
+        competition_id=input.competition_id,
+        participant_id=input.participant_id,
+        rating=input.rating,
+        previous_rating=previous_rating
+    )
     
     # Broadcast vote update
     await manager.broadcast_to_room(
-        safe_json_dumps({"type": "new_vote", "vote": vote.dict()}),
+        encode_event("new_vote", vote=vote, is_new=is_new),
         input.competition_id
     )
+    await leaderboards.publish(input.competition_id)
     
-    return vote
+    return VoteResult(**vote.dict(), is_new=is_new)
+
+def leaderboard_pipeline(competition_id: str) -> List[dict]:
+    """Per-participant average star rating, best first, computed inside MongoDB"""
+    return [
+        {"$match": {"competition_id": competition_id}},
+        {"$group": {
+            "_id": "$participant_id",
+            "total": {"$sum": "$rating"},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "participant_id": "$_id",
+            "average_rating": {"$round": [{"$divide": ["$total", "$count"]}, 2]},
+            "total_votes": "$count"
+        }},
+        {"$sort": {"average_rating": -1, "participant_id": 1}}
+    ]
 
 @api_router.get("/competitions/{competition_id}/results")
 async def get_competition_results(competition_id: str):
-    votes = await db.votes.find({"competition_id": competition_id}).to_list(1000)
-    
-    # Calculate average ratings for each participant
-    results = {}
-    for vote_data in votes:
-        vote = Vote(**vote_data)
-        if vote.participant_id not in results:
-            results[vote.participant_id] = {"total": 0, "count": 0}
-        results[vote.participant_id]["total"] += vote.rating
-        results[vote.participant_id]["count"] += 1
-    
-    # Calculate averages and sort
-    final_results = []
-    for participant_id, data in results.items():
-        avg_rating = data["total"] / data["count"] if data["count"] > 0 else 0
-        final_results.append({
-            "participant_id": participant_id,
-            "average_rating": round(avg_rating, 2),
-            "total_votes": data["count"]
-        })
-    
-    final_results.sort(key=lambda x: x["average_rating"], reverse=True)
-    return final_results
+    if leaderboards.loaded:
+        return leaderboards.results(competition_id)
+    # One document per participant crosses the wire, however many votes there are
+    return await db.votes.aggregate(leaderboard_pipeline(competition_id)).to_list(None)
+
+# Reactions
+@api_router.post("/reactions")
+async def add_reaction(input: ReactionCreate):
+    bans.ensure_allowed(input.user_id)
+    if input.kind not in REACTION_KINDS:
+        raise HTTPException(status_code=400, detail="Unknown reaction")
+    await participant_cache.ensure_participant(input.competition_id, input.participant_id)
+    # Counted in memory; broadcast with the next tick and stored with the next flush
+    reactions.add(input.competition_id, input.participant_id, input.kind, input.count)
+    return {"message": "Reaction counted"}
+
+@api_router.get("/competitions/{competition_id}/reactions")
+async def get_reactions(competition_id: str):
+    await participant_cache.ensure_competition(competition_id)
+    return await reactions.counts(competition_id)
 
 # Chat system
 @api_router.post("/messages", response_model=ChatMessage)
 async def send_message(input: MessageCreate):
-    message = ChatMessage(**input.dict())
-    await db.messages.insert_one(message.dict())
-    
-    # Broadcast to room
-    await manager.broadcast_to_room(
-        safe_json_dumps({"type": "new_message", "message": message.dict()}),
-        input.competition_id
-    )
-    
+    bans.ensure_allowed(input.user_id)
+    message = screen_message(input)
+    if message is None:
+        raise HTTPException(status_code=400, detail="Message blocked by moderation rules")
+    # Stored and broadcast to the room with the next flush of the chat buffer
+    chat_ingest.add(message)
     return message
 
+@api_router.post("/messages/batch", response_model=List[ChatMessage])
+async def send_messages(input: List[MessageCreate]):
+    if len(input) > CHAT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {CHAT_BATCH_MAX} messages per batch")
+    # Messages from banned users and blocked messages are left out; the response lists the ones accepted
+    allowed = [item for item in input if not bans.is_banned(item.user_id)]
+    messages = [message for message in map(screen_message, allowed) if message is not None]
+    for message in messages:
+        chat_ingest.add(message)
+    return messages
+
 @api_router.get("/competitions/{competition_id}/messages", response_model=List[ChatMessage])
-async def get_messages(competition_id: str, limit: int = 100):
-    messages = await db.messages.find({"competition_id": competition_id}).sort("timestamp", -1).limit(limit).to_list(limit)
-    messages.reverse()  # Return in chronological order
-    return [ChatMessage(**msg) for msg in messages]
+async def get_messages(
+    competition_id: str,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    projection = field_projection(ChatMessage, fields)
+    if before is None and limit <= recent_chat.size:
+        # The recent tail, including every viewer join, comes from memory
+        messages = [message.dict() for message in await recent_chat.latest(competition_id, limit)]
+    else:
+        # Older pages fall back to MongoDB
+        messages = await db.messages.find(
+            {"competition_id": competition_id, **keyset_filter(before, "timestamp", "$lt")},
+            WITHOUT_OBJECT_ID
+        ).sort([("timestamp", DESCENDING), ("id", DESCENDING)]).limit(limit).to_list(limit)
+        messages.reverse()  # Return in chronological order
+    headers = {}
+    if len(messages) == limit:
+        headers["X-Before-Cursor"] = encode_page_cursor(messages[0], "timestamp")
+    if projection:
+        messages = [{field: message[field] for field in projection if field in message} for message in messages]
+    return lean_response(messages, headers)
 
 @api_router.post("/messages/{message_id}/moderate")
 async def moderate_message(message_id: str, admin_id: str):
-    result = await db.messages.update_one(
-        {"id": message_id}, 
-        {"$set": {"is_moderated": True}}
+    message = await db.messages.find_one_and_update(
+        {"id": message_id, "is_moderated": {"$ne": True}},
+        {"$set": {"is_moderated": True}},
+        projection={"_id": 0, "competition_id": 1}
     )
-    if result.modified_count == 0:
+    if message is None:
         raise HTTPException(status_code=404, detail="Message not found")
+    recent_chat.moderate(message["competition_id"], message_id)
+    await manager.publish_control("chat_moderated", competition_id=message["competition_id"], message_id=message_id)
     
     # Log admin action
     action = AdminAction(admin_id=admin_id, action_type="moderate_message", target_id=message_id)
@@ -483,40 +2226,288 @@ async def moderate_message(message_id: str, admin_id: str):
     
     return {"message": "Message moderated successfully"}
 
+# Chat moderation rules
+@api_router.get("/admin/moderation/rules", response_model=List[ModerationRule])
+async def get_moderation_rules():
+    rules = await db.moderation_rules.find({}, WITHOUT_OBJECT_ID).to_list(None)
+    return [ModerationRule(**rule) for rule in rules]
+
+@api_router.post("/admin/moderation/rules", response_model=ModerationRule)
+async def add_moderation_rule(input: ModerationRuleCreate, admin_id: str):
+    if input.is_regex:
+        error = regex_rule_error(input.pattern)
+        if error is not None:
+            raise HTTPException(status_code=400, detail=error)
+    rule = ModerationRule(**input.dict(), created_by=admin_id)
+    await db.moderation_rules.insert_one(rule.dict())
+    await moderation.reload()
+    await manager.publish_control("moderation_rules_changed")
+    
+    # Log admin action
+    action = AdminAction(admin_id=admin_id, action_type="add_moderation_rule", target_id=rule.id)
+    await db.admin_actions.insert_one(action.dict())
+    
+    return rule
+
+@api_router.delete("/admin/moderation/rules/{rule_id}")
+async def delete_moderation_rule(rule_id: str, admin_id: str):
+    result = await db.moderation_rules.delete_one({"id": rule_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Moderation rule not found")
+    await moderation.reload()
+    await manager.publish_control("moderation_rules_changed")
+    
+    # Log admin action
+    action = AdminAction(admin_id=admin_id, action_type="delete_moderation_rule", target_id=rule_id)
+    await db.admin_actions.insert_one(action.dict())
+    
+    return {"message": "Moderation rule deleted"}
+
 # Admin analytics
+@api_router.get("/admin/cache/users")
+async def get_user_cache_stats():
+    return user_cache.stats()
+
 @api_router.get("/admin/stats")
 async def get_admin_stats():
-    total_users = await db.users.count_documents({})
-    active_competitions = await db.competitions.count_documents({"status": "active"})
-    total_votes = await db.votes.count_documents({})
-    total_messages = await db.messages.count_documents({})
-    banned_users = await db.users.count_documents({"is_banned": True})
-    
-    return {
-        "total_users": total_users,
-        "active_competitions": active_competitions,
-        "total_votes": total_votes,
-        "total_messages": total_messages,
-        "banned_users": banned_users
-    }
+    return await admin_stats.snapshot()
 
 @api_router.get("/admin/actions", response_model=List[AdminAction])
 async def get_admin_actions(limit: int = 100):
-    actions = await db.admin_actions.find().sort("timestamp", -1).limit(limit).to_list(limit)
+    actions = await db.admin_actions.find({}, WITHOUT_OBJECT_ID).sort("timestamp", -1).limit(limit).to_list(limit)
     return [AdminAction(**action) for action in actions]
 
 # WebSocket endpoint
+# A viewer joining a room gets one snapshot frame holding everything the page
+# shows. Competition and voting state are read concurrently, chat, the leaderboard
+# and reactions come from memory, and a build is shared by every join to the room
+# within SNAPSHOT_REUSE_MS; frames delivered since the build started are sent after it.
+# Builds are kept for at most SNAPSHOT_CACHE_ROOMS rooms and dropped once stale.
+SNAPSHOT_REUSE_MS = int(os.environ.get('SNAPSHOT_REUSE_MS', '500'))
+SNAPSHOT_CHAT_SIZE = int(os.environ.get('SNAPSHOT_CHAT_SIZE', '50'))
+SNAPSHOT_CACHE_ROOMS = int(os.environ.get('SNAPSHOT_CACHE_ROOMS', '1000'))
+
+class RoomSnapshots:
+    """Consolidated join frames per competition, built at most once per reuse window"""
+
+    def __init__(self, reuse_seconds: float = SNAPSHOT_REUSE_MS / 1000, max_rooms: int = SNAPSHOT_CACHE_ROOMS):
+        # competition_id -> (seq, frame) of the last finished build, until it is reuse_seconds old
+        self._latest = LruCache(max_rooms, reuse_seconds)
+        self._building = SingleFlight()
+        self.builds = 0
+
+    async def get(self, competition_id: str) -> Tuple[int, str]:
+        latest = self._latest.get(competition_id)
+        if latest is not None:
+            return latest
+        # Joins that arrive while a build runs share it
+        return await self._building.run(competition_id, lambda: self._build(competition_id))
+
+    async def _build(self, competition_id: str) -> Tuple[int, str]:
+        self.builds += 1
+        seq = manager.room_seq(competition_id)
+        competition, voting_sessions, messages, leaderboard = await asyncio.gather(
+            db.competitions.find_one({"id": competition_id}, WITHOUT_OBJECT_ID),
+            get_voting_snapshot(competition_id),
+            recent_chat.latest(competition_id, SNAPSHOT_CHAT_SIZE),
+            get_competition_results(competition_id)
+        )
+        if competition is None:
+            # A made-up room id gets an empty snapshot; nothing is loaded or kept for it
+            return seq, encode_event(
+                "snapshot",
+                competition_id=competition_id,
+                epoch=manager.node_id,
+                seq=seq,
+                competition=None,
+                voting_sessions=[],
+                messages=[],
+                leaderboard=[],
+                reactions={}
+            )
+        reaction_counts = await reactions.counts(competition_id)
+        snapshot = seq, encode_event(
+            "snapshot",
+            competition_id=competition_id,
+            epoch=manager.node_id,
+            seq=seq,
+            competition=Competition(**competition),
+            voting_sessions=voting_sessions,
+            messages=messages,
+            leaderboard=leaderboard,
+            reactions=reaction_counts
+        )
+        self._latest.put(competition_id, snapshot)
+        return snapshot
+
+    def discard(self, competition_id: str):
+        self._latest.pop(competition_id)
+
+room_snapshots = RoomSnapshots()
+
+# Inbound WebSocket protocol: every client frame names a registered type, is
+# validated against that type's schema and spends a token from the sender's bucket
+# for that type. Writes go through the same handlers as the REST API; nothing a
+# client sends is relayed to the room as-is.
+WS_MAX_FRAME_BYTES = int(os.environ.get('WS_MAX_FRAME_BYTES', '4096'))
+# Frames that match no route share one bucket per connection; past it they are dropped unanswered
+WS_REJECTED_FRAME_RATE = 1
+WS_REJECTED_FRAME_BURST = 5
+# Key of that bucket among the per-type buckets; not a valid frame type
+WS_REJECTED_BUCKET = "*rejected"
+
+class TokenBucket:
+    """Allows rate events per second on average, in bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class WsRoute:
+    def __init__(self, schema, handler, rate: float, burst: int, needs_user: bool):
+        self.schema = schema
+        self.handler = handler
+        self.rate = rate
+        self.burst = burst
+        self.needs_user = needs_user
+
+WS_ROUTES: Dict[str, WsRoute] = {}
+
+def ws_route(frame_type: str, schema, rate: float, burst: int, needs_user: bool = True):
+    """Register handler(websocket, competition_id, user_id, frame) for one inbound frame type"""
+    def register(handler):
+        WS_ROUTES[frame_type] = WsRoute(schema, handler, rate, burst, needs_user)
+        return handler
+    return register
+
+class ResyncFrame(BaseModel):
+    pass
+
+class ChatFrame(BaseModel):
+    username: str
+    message: str
+
+class VoteFrame(BaseModel):
+    participant_id: str
+    vote_type: str = "star"
+    rating: int = 5
+
+class LiveVoteFrame(BaseModel):
+    voting_session_id: str
+    selected_option: str
+
+class ReactionFrame(BaseModel):
+    participant_id: str
+    kind: str = "like"
+    count: int = Field(1, ge=1, le=50)
+
+@ws_route("resync", ResyncFrame, rate=0.5, burst=2, needs_user=False)
+async def ws_resync(websocket: WebSocket, competition_id: str, user_id: Optional[str], frame: ResyncFrame):
+    await manager.resync(websocket, room_snapshots.get)
+
+@ws_route("chat", ChatFrame, rate=1, burst=5)
+async def ws_chat(websocket: WebSocket, competition_id: str, user_id: str, frame: ChatFrame):
+    await send_message(MessageCreate(competition_id=competition_id, user_id=user_id, **frame.dict()))
+
+@ws_route("vote", VoteFrame, rate=2, burst=5)
+async def ws_vote(websocket: WebSocket, competition_id: str, user_id: str, frame: VoteFrame):
+    await cast_vote(VoteCreate(competition_id=competition_id, voter_id=user_id, **frame.dict()))
+
+@ws_route("live_vote", LiveVoteFrame, rate=2, burst=5)
+async def ws_live_vote(websocket: WebSocket, competition_id: str, user_id: str, frame: LiveVoteFrame):
+    await submit_live_vote(LiveVoteSubmit(voter_id=user_id, **frame.dict()))
+
+@ws_route("reaction", ReactionFrame, rate=20, burst=50)
+async def ws_reaction(websocket: WebSocket, competition_id: str, user_id: str, frame: ReactionFrame):
+    await add_reaction(ReactionCreate(competition_id=competition_id, user_id=user_id, **frame.dict()))
+
+async def reject_frame(websocket: WebSocket, code: str, detail: str):
+    await manager.send_personal_message(encode_event("error", code=code, detail=detail), websocket)
+
+async def reject_unrouted_frame(websocket: WebSocket, buckets: Dict[str, TokenBucket], code: str, detail: str):
+    bucket = buckets.get(WS_REJECTED_BUCKET)
+    if bucket is None:
+        bucket = buckets[WS_REJECTED_BUCKET] = TokenBucket(WS_REJECTED_FRAME_RATE, WS_REJECTED_FRAME_BURST)
+    if bucket.take():
+        await reject_frame(websocket, code, detail)
+
+def frame_too_large(data: str) -> bool:
+    # A character is 1 to 4 bytes of UTF-8, so only frames near the limit need encoding
+    if len(data) > WS_MAX_FRAME_BYTES:
+        return True
+    return len(data) * 4 > WS_MAX_FRAME_BYTES and len(data.encode()) > WS_MAX_FRAME_BYTES
+
+async def handle_ws_frame(
+    websocket: WebSocket,
+    competition_id: str,
+    user_id: Optional[str],
+    data: str,
+    buckets: Dict[str, TokenBucket]
+):
+    """Route one client frame; problems are answered with an error frame to the sender only"""
+    if frame_too_large(data):
+        return await reject_unrouted_frame(
+            websocket, buckets, "too_large", f"Frames are limited to {WS_MAX_FRAME_BYTES} bytes"
+        )
+    try:
+        raw = json.loads(data)
+        frame_type = raw["type"]
+        route = WS_ROUTES[frame_type]
+    except (ValueError, TypeError, KeyError):
+        return await reject_unrouted_frame(
+            websocket, buckets, "unknown_type", "Frames must be JSON objects with a known type"
+        )
+    bucket = buckets.get(frame_type)
+    if bucket is None:
+        bucket = buckets[frame_type] = TokenBucket(route.rate, route.burst)
+    if not bucket.take():
+        return await reject_frame(websocket, "rate_limited", f"Too many {frame_type} frames")
+    if route.needs_user and not user_id:
+        return await reject_frame(websocket, "unauthenticated", "Connect with a user_id to send this frame")
+    try:
+        frame = route.schema(**raw)
+    except ValueError as exc:
+        return await reject_frame(websocket, "invalid", str(exc))
+    try:
+        await route.handler(websocket, competition_id, user_id, frame)
+    except HTTPException as exc:
+        await reject_frame(websocket, "rejected", exc.detail)
+
 @app.websocket("/ws/{competition_id}")
-async def websocket_endpoint(websocket: WebSocket, competition_id: str):
-    await manager.connect(websocket, competition_id)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    competition_id: str,
+    user_id: Optional[str] = None,
+    since: Optional[int] = None,
+    epoch: Optional[str] = None
+):
+    if bans.is_banned(user_id):
+        await websocket.close(code=WS_CLOSE_BANNED)
+        return
+    # A client reconnecting with ?since=<seq>&epoch=<epoch> from its last frame gets only
+    # what it missed; one that fell too far behind or changed worker gets a snapshot
+    await manager.connect(websocket, competition_id, user_id, since, epoch, snapshot=room_snapshots.get)
+    buckets: Dict[str, TokenBucket] = {}
     try:
         while True:
             data = await websocket.receive_text()
-            # Handle different types of real-time messages
-            message_data = json.loads(data)
-            await manager.broadcast_to_room(data, competition_id)
+            await handle_ws_frame(websocket, competition_id, user_id, data, buckets)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, competition_id)
+        pass
+    finally:
+        # Also runs when the loop dies unexpectedly, so the socket never lingers in a room
+        manager.disconnect(websocket)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -527,6 +2518,8 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Page cursors travel in headers the browser hides from scripts unless exposed
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor"],
 )
 
 # Configure logging
@@ -536,6 +2529,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def remove_duplicate_voters(collection: str) -> int:
+    """Delete all but one document per voter key in collection; returns how many went"""
+    fields, keep_first = VOTER_UNIQUE_KEYS[collection]
+    duplicates = await db[collection].aggregate([
+        {"$sort": dict(keep_first)},
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]).to_list(None)
+    extra = [_id for group in duplicates for _id in group["ids"][1:]]
+    if not extra:
+        return 0
+    if collection == "live_voting_ballots":
+        # The removed ballots were counted too; take them back out of their sessions
+        removed = await db.live_voting_ballots.find(
+            {"_id": {"$in": extra}}, {"_id": 0, "voting_session_id": 1, "selected_option": 1}
+        ).to_list(None)
+        for ballot in removed:
+            await db.live_voting.update_one(
+                {"id": ballot["voting_session_id"]},
+                {"$inc": {vote_option_path(ballot["selected_option"]): -1}}
+            )
+    await db[collection].delete_many({"_id": {"$in": extra}})
+    logger.warning("Removed %d duplicate voter documents from %s", len(extra), collection)
+    return len(extra)
+
+@app.on_event("startup")
+async def create_indexes():
+    slow_queries.loop = asyncio.get_running_loop()
+    for collection, indexes in COLLECTION_INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except PyMongoError as exc:
+            if collection not in VOTER_UNIQUE_KEYS:
+                # e.g. existing duplicates blocking a unique index; keep serving and say so
+                logger.error("Could not create indexes on %s: %s", collection, exc)
+                continue
+            # These indexes are the double-vote check; serving without them would count repeat votes.
+            # Duplicates can only predate the index, so they are looked for only when it fails on them.
+            try:
+                if not isinstance(exc, DuplicateKeyError):
+                    raise
+                await remove_duplicate_voters(collection)
+                await db[collection].create_indexes(indexes)
+            except PyMongoError as retry_exc:
+                raise RuntimeError(f"Could not create the unique voter index on {collection}") from retry_exc
+
+# Open before the caches load, so no control message published meanwhile is missed
+@app.on_event("startup")
+async def start_backplane():
+    await manager.start()
+
+@app.on_event("startup")
+async def load_leaderboards():
+    await leaderboards.rebuild()
+
+@app.on_event("startup")
+async def load_bans():
+    await bans.load()
+
+@app.on_event("startup")
+async def load_moderation_rules():
+    await moderation.reload()
+
+@app.on_event("startup")
+async def start_admin_stats():
+    admin_stats.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    voting_tallies.close()
+    admin_stats.close()
+    await chat_ingest.close()
+    await reactions.close()
+    await manager.close()
     client.close()
\ No newline at end of file
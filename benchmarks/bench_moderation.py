@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Latency of the chat moderation filter on the send path.
+
+Builds a rule set of single words, phrases and a few regexes, then times
+ModerationFilter.check on a stream of chat lines (mostly clean, some masked,
+some blocked). The budget is 5k msgs/s on one core, i.e. 200 us per message;
+the filter should sit well inside that, in single-digit microseconds. A naive
+one-regex-per-rule loop is timed alongside for comparison.
+
+    python benchmarks/bench_moderation.py [--rules 1000] [--messages 5000] [--json]
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+BUDGET_US = 1_000_000 / 5000
+
+VOCABULARY = (
+    "that last round was unreal who else is voting for them tonight the crowd "
+    "loves this song again please more energy lets go vote now best stream ever "
+    "so close between the two of them"
+).split()
+
+
+def build_rules(count: int, rng: random.Random):
+    rules = []
+    for index in range(count):
+        kind = index % 50
+        if kind == 0:
+            rules.append(server.ModerationRule(pattern=rf"\bspam{index}\d+\b", is_regex=True, created_by="bench"))
+        elif kind < 5:
+            words = f"bad{index} phrase{index}"
+            rules.append(server.ModerationRule(pattern=words, action="block", created_by="bench"))
+        else:
+            action = "block" if index % 3 == 0 else "mask"
+            rules.append(server.ModerationRule(pattern=f"banned{index}", action=action, created_by="bench"))
+    return rules
+
+
+def build_messages(count: int, rules, rng: random.Random):
+    words = [rule.pattern for rule in rules if not rule.is_regex and " " not in rule.pattern]
+    phrases = [rule.pattern for rule in rules if not rule.is_regex and " " in rule.pattern]
+    messages = []
+    for index in range(count):
+        line = rng.choices(VOCABULARY, k=rng.randint(4, 14))
+        roll = rng.random()
+        if roll < 0.05:
+            line.insert(rng.randrange(len(line)), rng.choice(words))
+        elif roll < 0.07 and phrases:
+            line.insert(rng.randrange(len(line)), rng.choice(phrases))
+        messages.append(" ".join(line))
+    return messages
+
+
+def naive_check(compiled, text):
+    for pattern, action in compiled:
+        if pattern.search(text):
+            if action == "block":
+                return True, text
+            text = pattern.sub(lambda match: "*" * len(match.group()), text)
+    return False, text
+
+
+def time_each(check, messages):
+    timings = []
+    for text in messages:
+        start = time.perf_counter_ns()
+        check(text)
+        timings.append((time.perf_counter_ns() - start) / 1000)
+    timings.sort()
+    return {
+        "mean_us": round(statistics.fmean(timings), 2),
+        "p50_us": round(timings[len(timings) // 2], 2),
+        "p99_us": round(timings[int(len(timings) * 0.99)], 2),
+        "msgs_per_second": round(1_000_000 / statistics.fmean(timings)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rules", type=int, default=1000, help="number of moderation rules")
+    parser.add_argument("--messages", type=int, default=5000, help="chat lines to check")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    rules = build_rules(args.rules, rng)
+    messages = build_messages(args.messages, rules, rng)
+
+    start = time.perf_counter()
+    moderation = server.ModerationFilter(rules)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    naive = [
+        (re.compile(rule.pattern if rule.is_regex else rf"\b{re.escape(rule.pattern)}\b", re.IGNORECASE), rule.action)
+        for rule in rules
+    ]
+    results = {
+        "rules": args.rules,
+        "messages": args.messages,
+        "budget_us": BUDGET_US,
+        "compile_ms": round(compile_ms, 2),
+        "filter": time_each(moderation.check, messages),
+        "naive_per_rule_regex": time_each(lambda text: naive_check(naive, text), messages[: max(1, args.messages // 10)]),
+    }
+    results["within_budget"] = results["filter"]["p99_us"] < BUDGET_US
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.rules} rules, {args.messages} messages, budget {BUDGET_US:.0f} us/message (5k msgs/s)")
+    print(f"compile: {results['compile_ms']} ms")
+    for name in ("filter", "naive_per_rule_regex"):
+        result = results[name]
+        print(
+            f"{name:22} mean {result['mean_us']:>9} us  p50 {result['p50_us']:>9} us  "
+            f"p99 {result['p99_us']:>9} us  {result['msgs_per_second']:>9} msgs/s"
+        )
+    print("within budget" if results["within_budget"] else "OVER BUDGET")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Per-request CPU and wire bytes for the hot read endpoints, before and after field projections.
+
+"before" is a full document as the driver returned it (including _id), rebuilt
+into the pydantic model and encoded the way FastAPI encodes a response_model.
+"after" is the projected document the endpoint now fetches with ?fields=,
+encoded directly. Bytes are the BSON size Mongo sends plus the JSON body size.
+
+    python benchmarks/bench_projections.py [--page-size 100] [--requests 200] [--json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def sample_documents(page_size: int):
+    now = datetime.utcnow()
+    users = [
+        {
+            "_id": bson.ObjectId(),
+            **server.User(
+                username=f"viewer_{index}",
+                email=f"viewer_{index}@example.com",
+                role="viewer",
+                avatar_url=f"https://cdn.example.com/avatars/{index}.jpg",
+                created_at=now,
+            ).model_dump(),
+        }
+        for index in range(page_size)
+    ]
+    competitions = [
+        {
+            "_id": bson.ObjectId(),
+            **server.Competition(
+                title=f"Friday night battle #{index}",
+                description="Six streamers, one crown. Vote for your favourite performance." * 3,
+                moderator_id="moderator",
+                participants=[f"participant-{slot}" for slot in range(6)],
+                created_at=now,
+            ).model_dump(),
+        }
+        for index in range(page_size)
+    ]
+    messages = [
+        {
+            "_id": bson.ObjectId(),
+            **server.ChatMessage(
+                competition_id="competition",
+                user_id=f"user-{index}",
+                username=f"viewer_{index}",
+                message="that last round was unreal, who else is voting for them?",
+                timestamp=now,
+            ).model_dump(),
+        }
+        for index in range(page_size)
+    ]
+    return {
+        "users?fields=id,username,avatar_url": (server.User, users, "id,username,avatar_url"),
+        "competitions?fields=id,title,status": (server.Competition, competitions, "id,title,status"),
+        "messages?fields=username,message,timestamp": (server.ChatMessage, messages, "username,message,timestamp"),
+    }
+
+
+def full_response(model, docs):
+    wire = sum(len(bson.encode(doc)) for doc in docs)
+    body = json.dumps(jsonable_encoder([model(**doc) for doc in docs]))
+    return wire, len(body)
+
+
+def projected_response(model, docs, fields):
+    projection = server.field_projection(model, fields)
+    projected = [{key: doc[key] for key, include in projection.items() if include and key in doc} for doc in docs]
+    wire = sum(len(bson.encode(doc)) for doc in projected)
+    body = server.safe_json_dumps(projected)
+    return wire, len(body)
+
+
+def measure(handler, requests: int):
+    handler()
+    start = time.process_time_ns()
+    for _ in range(requests):
+        wire, body = handler()
+    cpu_us = (time.process_time_ns() - start) / requests / 1000
+    return {"cpu_us_per_request": round(cpu_us, 1), "wire_bytes": wire, "body_bytes": body}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--page-size", type=int, default=100, help="documents per response")
+    parser.add_argument("--requests", type=int, default=200, help="requests timed per case")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (model, docs, fields) in sample_documents(args.page_size).items():
+        results[name] = {
+            "before": measure(lambda: full_response(model, docs), args.requests),
+            "after": measure(lambda: projected_response(model, docs, fields), args.requests),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.page_size} documents per request, {args.requests} requests per case")
+    print(f"{'endpoint':45} {'cpu us before':>14} {'after':>8} {'wire B before':>14} {'after':>8} {'body B before':>14} {'after':>8}")
+    for name, result in results.items():
+        before, after = result["before"], result["after"]
+        print(
+            f"{name:45} {before['cpu_us_per_request']:>14} {after['cpu_us_per_request']:>8} "
+            f"{before['wire_bytes']:>14} {after['wire_bytes']:>8} {before['body_bytes']:>14} {after['body_bytes']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
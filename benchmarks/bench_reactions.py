@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Throughput of the reactions path for one busy room.
+
+Sprays taps at POST /reactions' handler for a few seconds while the tick
+and flush tasks run against the in-memory Motor stand-in from tests/, with
+a handful of viewers connected. The target is 50k taps/s per room on one
+process; each tick should cost one broadcast and each flush one bulk_write,
+whatever the tap rate. After the run every tap must be in MongoDB.
+
+    python benchmarks/bench_reactions.py [--seconds 3] [--participants 10] [--viewers 100] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT))
+
+import server  # noqa: E402
+from tests.fake_motor import FakeDatabase  # noqa: E402
+from tests.fake_websocket import RecordingWebSocket  # noqa: E402
+
+TARGET_TAPS_PER_SECOND = 50_000
+KINDS = sorted(server.REACTION_KINDS)
+
+
+async def run(seconds: float, participants: int, viewers: int) -> dict:
+    server.db = FakeDatabase()
+    server.manager = server.ConnectionManager()
+    server.bans = server.BanList()
+    server.reactions = server.ReactionCounters()
+    server.participant_cache = server.ParticipantCache()
+    # Taps are only counted for participants of an existing competition
+    await server.db.competitions.insert_one(server.Competition(
+        id="bench-room",
+        title="Benchmark",
+        description="",
+        moderator_id="bench",
+        max_participants=participants,
+        participants=[f"participant-{index}" for index in range(participants)]
+    ).dict())
+    sockets = [RecordingWebSocket() for _ in range(viewers)]
+    for websocket in sockets:
+        await server.manager.connect(websocket, "bench-room")
+    writes = []
+    bulk_write = server.db.reactions.bulk_write
+    server.db.reactions.bulk_write = lambda requests, **kwargs: writes.append(len(requests)) or bulk_write(requests, **kwargs)
+
+    taps = [
+        server.ReactionCreate(
+            competition_id="bench-room",
+            participant_id=f"participant-{index % participants}",
+            user_id=f"viewer-{index}",
+            kind=KINDS[index % len(KINDS)]
+        )
+        for index in range(1000)
+    ]
+    sent = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for tap in taps:
+            await server.add_reaction(tap)
+        sent += len(taps)
+        # Let the ticker and the socket writers run between bursts, as the event loop would
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await server.reactions.close()
+    await asyncio.sleep(0.01)
+
+    stored = sum(
+        sum(doc["counts"].values()) for doc in server.db.reactions.documents.values()
+    )
+    frames = [json.loads(frame) for frame in sockets[0].frames]
+    return {
+        "seconds": round(elapsed, 2),
+        "participants": participants,
+        "viewers": viewers,
+        "taps": sent,
+        "taps_per_second": round(sent / elapsed),
+        "broadcasts": sum(1 for frame in frames if frame["type"] == "reactions_update"),
+        "bulk_writes": len(writes),
+        "stored_taps": stored,
+        "all_taps_stored": stored == sent,
+        "within_target": sent / elapsed >= TARGET_TAPS_PER_SECOND,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=3, help="how long to spray taps")
+    parser.add_argument("--participants", type=int, default=10, help="participants receiving reactions")
+    parser.add_argument("--viewers", type=int, default=100, help="connected sockets in the room")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.seconds, args.participants, args.viewers))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['taps']} taps in {results['seconds']} s: {results['taps_per_second']} taps/s "
+          f"(target {TARGET_TAPS_PER_SECOND})")
+    print(f"{results['broadcasts']} broadcasts to {results['viewers']} viewers, {results['bulk_writes']} bulk writes")
+    print(f"stored {results['stored_taps']} taps" + ("" if results["all_taps_stored"] else " -- TAPS LOST"))
+    print("within target" if results["within_target"] else "BELOW TARGET")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Encoding cost of the typical WebSocket frames, old path versus encode_event.
+
+"old" is what every call site used to do: build a dict with model.dict() and
+run json.dumps with the datetime default hook. "new" is encode_event, which
+dumps pydantic models with pydantic-core and the rest with orjson when it is
+installed (the stdlib fallback is timed too).
+
+    python benchmarks/bench_serialization.py [--iterations 20000] [--json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def old_dumps(data):
+    return json.dumps(data, default=server.json_serializer)
+
+
+def frames():
+    message = server.ChatMessage(
+        competition_id="competition",
+        user_id="user",
+        username="viewer_42",
+        message="that last round was unreal, who else is voting for them?",
+    )
+    session = server.LiveVotingSession(
+        competition_id="competition",
+        question="Who had the best performance tonight?",
+        options=[f"participant-{slot}" for slot in range(6)],
+        votes={f"participant-{slot}": 1000 + slot for slot in range(6)},
+    )
+    updates = [{"voting_session_id": session.id, "votes": {"participant-1": 1502, "participant-4": 988}}]
+    return {
+        "new_message": (
+            lambda: old_dumps({"type": "new_message", "message": message.dict()}),
+            lambda: server.encode_event("new_message", message=message),
+        ),
+        "voting_update": (
+            lambda: old_dumps({"type": "voting_update", "competition_id": "competition", "updates": updates}),
+            lambda: server.encode_event("voting_update", competition_id="competition", updates=updates),
+        ),
+        "voting_started": (
+            lambda: old_dumps({"type": "voting_started", "voting_session": session.dict()}),
+            lambda: server.encode_event("voting_started", voting_session=session),
+        ),
+    }
+
+
+def time_us(encode, iterations: int) -> float:
+    encode()
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        encode()
+    return round((time.perf_counter_ns() - start) / iterations / 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000, help="encodes timed per case")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (old, new) in frames().items():
+        assert json.loads(old()) == json.loads(new()), name
+        result = {"old_us": time_us(old, args.iterations), "new_us": time_us(new, args.iterations)}
+        if server.orjson is not None:
+            # Same frame with orjson disabled, as on a deployment without it
+            orjson, server.orjson = server.orjson, None
+            try:
+                result["new_stdlib_us"] = time_us(new, args.iterations)
+            finally:
+                server.orjson = orjson
+        results[name] = result
+
+    if args.json:
+        print(json.dumps({"orjson": server.orjson is not None, "frames": results}, indent=2))
+        return
+    print(f"orjson installed: {server.orjson is not None}, {args.iterations} encodes per case")
+    print(f"{'frame':16} {'old us':>8} {'new us':>8} {'new, stdlib us':>15}")
+    for name, result in results.items():
+        print(f"{name:16} {result['old_us']:>8} {result['new_us']:>8} {result.get('new_stdlib_us', '-'):>15}")
+
+
+if __name__ == "__main__":
+    main()
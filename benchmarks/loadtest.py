@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Local load test of the whole backend against an in-memory MongoDB stand-in.
+
+Boots server.app in-process on the fake Motor database from tests/ (startup
+and shutdown hooks included), then:
+
+  1. joins --viewers sockets to one competition at once and times each join
+     (snapshot frame included),
+  2. fires a mixed burst through the ASGI app with httpx: one /api/voting/submit
+     and one /api/votes per voter plus --messages /api/messages, at most
+     --concurrency requests in flight,
+  3. waits for the tick and flush tasks to drain and measures how long every
+     room broadcast took to reach the last viewer.
+
+Viewers are attached at the ConnectionManager, so the WebSocket handshake is not
+part of the numbers; everything behind it (send queues, writer tasks, snapshot
+builds, broadcasts) is. Results are printed as JSON with --json, for comparing
+branches:
+
+    python benchmarks/loadtest.py --label main --json > main.json
+    python benchmarks/loadtest.py [--viewers 2000] [--voters 1000] [--messages 2000] [--concurrency 100] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+from tests.fake_motor import FakeDatabase  # noqa: E402
+
+PARTICIPANTS = 5
+
+
+class BroadcastTimes:
+    """When each room frame was published and when its last copy was written to a viewer"""
+
+    def __init__(self):
+        self.published = {}
+        self.last_received = {}
+
+    def deliver(self, room_id, message, key=None):
+        start = time.perf_counter()
+        server.manager.deliver_local(room_id, message, key)
+        self.published.setdefault(server.manager.room_seq(room_id), start)
+
+    def received(self, seq):
+        self.last_received[seq] = time.perf_counter()
+
+    def fanout_ms(self):
+        return [
+            (self.last_received[seq] - start) * 1000
+            for seq, start in self.published.items()
+            if seq in self.last_received
+        ]
+
+
+class Viewer:
+    """In-process socket that counts and timestamps frames instead of keeping them"""
+
+    def __init__(self, times: BroadcastTimes):
+        self.times = times
+        self.frames = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.frames += 1
+        if message.startswith('{"seq":'):
+            self.times.received(int(message[7:message.index(",", 7)]))
+
+    async def close(self, code=1000):
+        pass
+
+
+def summary(samples_ms, elapsed=None):
+    samples = sorted(samples_ms)
+    if not samples:
+        return {"count": 0}
+    result = {
+        "count": len(samples),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+    if elapsed:
+        result["per_second"] = round(len(samples) / elapsed)
+    return result
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def timed_request(http, limit, latencies, errors, method, url, body):
+    async with limit:
+        start = time.perf_counter()
+        response = await http.request(method, url, json=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+    if response.status_code >= 400:
+        errors[response.status_code] = errors.get(response.status_code, 0) + 1
+    return response
+
+
+async def run(viewers: int, voters: int, messages: int, concurrency: int) -> dict:
+    # One INFO line per request would dominate the run
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server.db = FakeDatabase()
+    for handler in server.app.router.on_startup:
+        await handler()
+    times = BroadcastTimes()
+    server.manager.backplane.attach(times.deliver)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+        # Setup, untimed
+        participants = [
+            (await http.post("/api/users", json={"username": f"performer{index}", "role": "participant"})).json()["id"]
+            for index in range(PARTICIPANTS)
+        ]
+        competition = (await http.post("/api/competitions", json={
+            "title": "Load test", "description": "", "moderator_id": "loadtest"
+        })).json()["id"]
+        for participant in participants:
+            await http.post(f"/api/competitions/{competition}/join", params={"user_id": participant})
+        await http.post(f"/api/competitions/{competition}/start")
+        session = (await http.post("/api/voting/create", json={
+            "competition_id": competition, "question": "Who wins?", "options": participants
+        })).json()["id"]
+
+        # 1. Join storm
+        rss_before_viewers = peak_rss_mb()
+        sockets = [Viewer(times) for _ in range(viewers)]
+
+        async def join(socket):
+            start = time.perf_counter()
+            await server.manager.connect(socket, competition, snapshot=server.room_snapshots.get)
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        join_ms = await asyncio.gather(*(join(socket) for socket in sockets))
+        join_elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.05)
+        rss_after_viewers = peak_rss_mb()
+
+        # 2. Mixed write burst
+        limit = asyncio.Semaphore(concurrency)
+        endpoints = {name: ([], {}) for name in ("voting_submit", "votes", "messages")}
+        requests = []
+        for index in range(voters):
+            voter = f"voter-{index}"
+            requests.append(("voting_submit", "POST", "/api/voting/submit", {
+                "voting_session_id": session, "voter_id": voter, "selected_option": participants[index % PARTICIPANTS]
+            }))
+            requests.append(("votes", "POST", "/api/votes", {
+                "competition_id": competition, "participant_id": participants[index % PARTICIPANTS],
+                "voter_id": voter, "rating": 1 + index % 5
+            }))
+        for index in range(messages):
+            requests.append(("messages", "POST", "/api/messages", {
+                "competition_id": competition, "user_id": f"voter-{index % max(voters, 1)}",
+                "username": f"viewer {index}", "message": f"message number {index} from the load test"
+            }))
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            timed_request(http, limit, *endpoints[name], method, url, body)
+            for name, method, url, body in requests
+        ))
+        burst_elapsed = time.perf_counter() - start
+
+        # 3. Let the voting, leaderboard and chat ticks reach every viewer
+        await asyncio.sleep(max(server.VOTING_TICK_MS, server.CHAT_FLUSH_MS, server.REACTIONS_TICK_MS) / 1000 * 3)
+        for handler in server.app.router.on_shutdown:
+            await handler()
+        await asyncio.sleep(0.05)
+
+    return {
+        "config": {
+            "viewers": viewers,
+            "voters": voters,
+            "messages": messages,
+            "concurrency": concurrency,
+            "python": platform.python_version(),
+            "orjson": server.orjson is not None,
+        },
+        "join": {**summary(join_ms, join_elapsed), "snapshot_builds": server.room_snapshots.builds},
+        "burst": {
+            "requests": len(requests),
+            "seconds": round(burst_elapsed, 3),
+            "requests_per_second": round(len(requests) / burst_elapsed),
+            "endpoints": {
+                name: {**summary(latencies, burst_elapsed), "errors": errors}
+                for name, (latencies, errors) in endpoints.items()
+            },
+        },
+        "fanout": {
+            **summary(times.fanout_ms()),
+            "frames_per_viewer": round(sum(socket.frames for socket in sockets) / max(viewers, 1), 1),
+        },
+        "memory": {
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "viewers_rss_mb": round(rss_after_viewers - rss_before_viewers, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--viewers", type=int, default=2000, help="sockets joined to the competition")
+    parser.add_argument("--voters", type=int, default=1000, help="users casting a live vote and a star vote each")
+    parser.add_argument("--messages", type=int, default=2000, help="chat messages posted during the burst")
+    parser.add_argument("--concurrency", type=int, default=100, help="requests in flight at once")
+    parser.add_argument("--label", default="", help="name for this run, e.g. the branch under test")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {"label": args.label, **asyncio.run(run(args.viewers, args.voters, args.messages, args.concurrency))}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    config = results["config"]
+    print(f"{config['viewers']} viewers, {config['voters']} voters, {config['messages']} messages, "
+          f"concurrency {config['concurrency']}")
+    join = results["join"]
+    print(f"join      p50 {join['p50_ms']:>8} ms  p99 {join['p99_ms']:>8} ms  "
+          f"{join['per_second']:>7} joins/s  {join['snapshot_builds']} snapshot builds")
+    burst = results["burst"]
+    print(f"burst     {burst['requests']} requests in {burst['seconds']} s: {burst['requests_per_second']} req/s")
+    for name, endpoint in burst["endpoints"].items():
+        print(f"  {name:14} p50 {endpoint['p50_ms']:>8} ms  p99 {endpoint['p99_ms']:>8} ms  "
+              f"{endpoint['per_second']:>7} req/s  errors {endpoint['errors'] or 0}")
+    fanout = results["fanout"]
+    if fanout["count"]:
+        print(f"fan-out   {fanout['count']} broadcasts  p50 {fanout['p50_ms']} ms  p99 {fanout['p99_ms']} ms  "
+              f"{fanout['frames_per_viewer']} frames/viewer")
+    memory = results["memory"]
+    print(f"memory    peak rss {memory['peak_rss_mb']} MB, {memory['viewers_rss_mb']} MB for the viewers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+from tests.fake_motor import FakeDatabase  # noqa: E402
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Point server.py at a fresh in-memory database"""
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    return database
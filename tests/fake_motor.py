@@ -0,0 +1,690 @@
+"""
+In-memory stand-in for the parts of Motor's collection API that server.py uses.
+
+Documents live in plain dicts, queries and updates follow MongoDB semantics for
+the operators the app relies on, and unique indexes are enforced so dedup logic
+can be exercised without a running mongod.
+"""
+
+import asyncio
+import copy
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+
+def _get(doc: Any, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _set(doc: dict, path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _sort_key(value: Any):
+    # Missing/None sort first, then numbers, strings, everything else
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (4, value)
+
+
+def _compare(op: str, actual: Any, expected: Any) -> bool:
+    if actual is _MISSING or actual is None:
+        return False
+    try:
+        if op == "$lt":
+            return actual < expected
+        if op == "$lte":
+            return actual <= expected
+        if op == "$gt":
+            return actual > expected
+        return actual >= expected
+    except TypeError:
+        return False
+
+
+def _equals(actual: Any, expected: Any) -> bool:
+    if actual is _MISSING:
+        return expected is None
+    if isinstance(actual, list) and not isinstance(expected, list):
+        return expected in actual
+    return actual == expected
+
+
+def _match_condition(actual: Any, condition: Any) -> bool:
+    if isinstance(condition, re.Pattern):
+        return isinstance(actual, str) and bool(condition.search(actual))
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        return _equals(actual, condition)
+    for op, expected in condition.items():
+        if op == "$eq":
+            ok = _equals(actual, expected)
+        elif op == "$ne":
+            ok = not _equals(actual, expected)
+        elif op == "$exists":
+            ok = (actual is not _MISSING) == bool(expected)
+        elif op == "$in":
+            ok = any(_equals(actual, item) for item in expected)
+        elif op == "$nin":
+            ok = not any(_equals(actual, item) for item in expected)
+        elif op in ("$lt", "$lte", "$gt", "$gte"):
+            if isinstance(actual, list):
+                ok = any(_compare(op, item, expected) for item in actual)
+            else:
+                ok = _compare(op, actual, expected)
+        elif op == "$size":
+            ok = isinstance(actual, list) and len(actual) == expected
+        elif op == "$elemMatch":
+            ok = isinstance(actual, list) and any(
+                _match_condition(item, expected) if not isinstance(item, dict) else matches(item, expected)
+                for item in actual
+            )
+        elif op == "$regex":
+            ok = isinstance(actual, str) and re.search(expected, actual) is not None
+        else:
+            raise NotImplementedError(f"query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, doc):
+                return False
+        elif not _match_condition(_get(doc, key), condition):
+            return False
+    return True
+
+
+def evaluate(expr: Any, doc: dict) -> Any:
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(item, doc) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {key: evaluate(value, doc) for key, value in expr.items()}
+    op, args = next(iter(expr.items()))
+    if op == "$literal":
+        return args
+    values = evaluate(args, doc) if isinstance(args, list) else [evaluate(args, doc)]
+    if op == "$size":
+        return len(values[0] or [])
+    if op in ("$lt", "$lte", "$gt", "$gte"):
+        return _compare(op, values[0], values[1])
+    if op == "$eq":
+        return values[0] == values[1]
+    if op == "$ne":
+        return values[0] != values[1]
+    if op == "$add":
+        return sum(values)
+    if op == "$subtract":
+        return values[0] - values[1]
+    if op == "$multiply":
+        result = 1
+        for value in values:
+            result *= value
+        return result
+    if op == "$divide":
+        return values[0] / values[1]
+    if op == "$round":
+        return round(values[0], values[1] if len(values) > 1 else 0)
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op == "$cond":
+        if isinstance(args, dict):
+            values = [evaluate(args["if"], doc), evaluate(args["then"], doc), evaluate(args["else"], doc)]
+        return values[1] if values[0] else values[2]
+    raise NotImplementedError(f"expression operator {op}")
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    inclusive = any(value not in (0, False) for value in fields.values())
+    if inclusive:
+        result = {}
+        for key, spec in fields.items():
+            value = _get(doc, key)
+            if value is _MISSING:
+                continue
+            if isinstance(spec, dict) and "$elemMatch" in spec:
+                found = [item for item in value if _match_condition(item, spec["$elemMatch"])][:1]
+                if found:
+                    _set(result, key, found)
+                continue
+            _set(result, key, copy.deepcopy(value))
+    else:
+        result = copy.deepcopy(doc)
+        for key in fields:
+            _unset(result, key)
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort_docs(docs: List[dict], spec: List[Tuple[str, int]]) -> List[dict]:
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+    return docs
+
+
+def _normalize_sort(key_or_list, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, count: int):
+        return self
+
+    def _evaluate(self) -> List[dict]:
+        if self._results is None:
+            docs = [doc for doc in self._collection.documents.values() if matches(doc, self._query)]
+            if self._sort:
+                docs = _sort_docs(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = [project(doc, self._projection) for doc in docs]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await asyncio.sleep(0)
+        results = self._evaluate()
+        return list(results if length is None else results[:length])
+
+    def __aiter__(self):
+        self._iter = iter(self._evaluate())
+        return self
+
+    async def __anext__(self) -> dict:
+        await asyncio.sleep(0)
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeAggregationCursor(FakeCursor):
+    def __init__(self, results: List[dict]):
+        self._results = results
+
+    def _evaluate(self) -> List[dict]:
+        return self._results
+
+
+class FakeChangeStream:
+    """Change stream over a FakeCollection; only insert events are produced"""
+
+    def __init__(self, collection: "FakeCollection", pipeline: Optional[List[dict]]):
+        self._collection = collection
+        self._match = [stage["$match"] for stage in pipeline or [] if "$match" in stage]
+        self._events: asyncio.Queue = asyncio.Queue()
+        self.resume_token = None
+
+    def push(self, event: dict):
+        if all(matches(event, query) for query in self._match):
+            self._events.put_nowait(event)
+
+    async def __aenter__(self):
+        self._collection._streams.append(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._collection._streams.remove(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        event = await self._events.get()
+        self.resume_token = event["_id"]
+        return event
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.documents: Dict[Any, dict] = {}
+        self.indexes: Dict[str, dict] = {}
+        # index name -> key tuple -> _id, for unique indexes only
+        self._unique: Dict[str, Dict[tuple, Any]] = {}
+        self._streams: List[FakeChangeStream] = []
+        self._event_counter = 0
+
+    # Indexes
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        spec = _normalize_sort(keys, 1)
+        name = name or "_".join(f"{key}_{direction}" for key, direction in spec)
+        self.indexes[name] = {"key": spec, "unique": unique, **kwargs}
+        if unique:
+            entries: Dict[tuple, Any] = {}
+            for _id, doc in self.documents.items():
+                key = self._index_key(doc, spec)
+                if key in entries:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+                entries[key] = _id
+            self._unique[name] = entries
+        return name
+
+    async def create_indexes(self, models) -> List[str]:
+        names = []
+        for model in models:
+            document = dict(model.document)
+            keys = list(document.pop("key").items())
+            names.append(await self.create_index(keys, **document))
+        return names
+
+    async def index_information(self) -> dict:
+        return {"_id_": {"key": [("_id", 1)]}, **self.indexes}
+
+    async def drop_index(self, name: str):
+        self.indexes.pop(name, None)
+        self._unique.pop(name, None)
+
+    @staticmethod
+    def _index_key(doc: dict, spec: List[Tuple[str, int]]) -> tuple:
+        return tuple(repr(_get(doc, key)) for key, _ in spec)
+
+    def _check_unique(self, doc: dict, _id: Any = None):
+        for name, entries in self._unique.items():
+            owner = entries.get(self._index_key(doc, self.indexes[name]["key"]))
+            if owner is not None and owner != _id:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+
+    def _index(self, doc: dict):
+        for name, entries in self._unique.items():
+            entries[self._index_key(doc, self.indexes[name]["key"])] = doc["_id"]
+
+    def _unindex(self, doc: dict):
+        for name, entries in self._unique.items():
+            key = self._index_key(doc, self.indexes[name]["key"])
+            if entries.get(key) == doc["_id"]:
+                del entries[key]
+
+    def _store(self, doc: dict):
+        self._check_unique(doc, doc["_id"])
+        self.documents[doc["_id"]] = doc
+        self._index(doc)
+        for stream in self._streams:
+            self._event_counter += 1
+            stream.push({
+                "_id": {"_data": self._event_counter},
+                "operationType": "insert",
+                "fullDocument": copy.deepcopy(doc),
+            })
+
+    def _replace(self, old: dict, new: dict):
+        self._unindex(old)
+        try:
+            self._check_unique(new, old["_id"])
+        except DuplicateKeyError:
+            self._index(old)
+            raise
+        self.documents[old["_id"]] = new
+        self._index(new)
+
+    # Writes
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await asyncio.sleep(0)
+        document.setdefault("_id", ObjectId())
+        self._store(copy.deepcopy(document))
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True) -> InsertManyResult:
+        await asyncio.sleep(0)
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                self._store(copy.deepcopy(document))
+                inserted.append(document["_id"])
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted, True)
+
+    def _first(self, query: dict, sort=None) -> Optional[dict]:
+        if sort:
+            docs = _sort_docs([doc for doc in self.documents.values() if matches(doc, query)], _normalize_sort(sort))
+            return docs[0] if docs else None
+        for doc in self.documents.values():
+            if matches(doc, query):
+                return doc
+        return None
+
+    @staticmethod
+    def _apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+        updated = copy.deepcopy(doc)
+        for op, fields in update.items():
+            for path, value in fields.items():
+                if op == "$set":
+                    _set(updated, path, copy.deepcopy(value))
+                elif op == "$setOnInsert":
+                    if inserting:
+                        _set(updated, path, copy.deepcopy(value))
+                elif op == "$unset":
+                    _unset(updated, path)
+                elif op == "$inc":
+                    current = _get(updated, path)
+                    _set(updated, path, (0 if current is _MISSING else current) + value)
+                elif op in ("$max", "$min"):
+                    current = _get(updated, path)
+                    if current is _MISSING or (value > current if op == "$max" else value < current):
+                        _set(updated, path, copy.deepcopy(value))
+                elif op in ("$push", "$addToSet"):
+                    current = _get(updated, path)
+                    items = [] if current is _MISSING else list(current)
+                    values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    for item in values:
+                        if op == "$push" or item not in items:
+                            items.append(copy.deepcopy(item))
+                    _set(updated, path, items)
+                elif op == "$pull":
+                    current = _get(updated, path)
+                    if current is not _MISSING:
+                        _set(updated, path, [item for item in current if not _match_condition(item, value)])
+                else:
+                    raise NotImplementedError(f"update operator {op}")
+        return updated
+
+    def _upsert_document(self, query: dict, update: dict) -> dict:
+        seed = {
+            key: value for key, value in query.items()
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        doc = self._apply_update({}, {"$set": seed}) if seed else {}
+        doc = self._apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        return doc
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> UpdateResult:
+        targets = [doc for doc in self.documents.values() if matches(doc, query)]
+        if not many:
+            targets = targets[:1]
+        modified = 0
+        for doc in targets:
+            updated = self._apply_update(doc, update)
+            if updated != doc:
+                self._replace(doc, updated)
+                modified += 1
+        if not targets and upsert:
+            doc = self._upsert_document(query, update)
+            self._store(doc)
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": doc["_id"]}, True)
+        return UpdateResult({"n": len(targets), "nModified": modified}, True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await asyncio.sleep(0)
+        return self._update(filter, update, upsert, many=False)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await asyncio.sleep(0)
+        return self._update(filter, update, upsert, many=True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        await asyncio.sleep(0)
+        doc = self._first(filter)
+        if doc is None:
+            if upsert:
+                await self.insert_one(replacement)
+                return UpdateResult({"n": 1, "nModified": 0, "upserted": replacement["_id"]}, True)
+            return UpdateResult({"n": 0, "nModified": 0}, True)
+        new = copy.deepcopy(replacement)
+        new["_id"] = doc["_id"]
+        self._replace(doc, new)
+        return UpdateResult({"n": 1, "nModified": int(new != doc)}, True)
+
+    async def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        projection: Optional[dict] = None,
+        sort=None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+    ) -> Optional[dict]:
+        await asyncio.sleep(0)
+        doc = self._first(filter, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self._upsert_document(filter, update)
+            self._store(doc)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        updated = self._apply_update(doc, update)
+        self._replace(doc, updated)
+        return project(updated if return_document == ReturnDocument.AFTER else doc, projection)
+
+    async def delete_one(self, filter: dict) -> DeleteResult:
+        await asyncio.sleep(0)
+        doc = self._first(filter)
+        if doc is None:
+            return DeleteResult({"n": 0}, True)
+        self._unindex(doc)
+        del self.documents[doc["_id"]]
+        return DeleteResult({"n": 1}, True)
+
+    async def delete_many(self, filter: dict) -> DeleteResult:
+        await asyncio.sleep(0)
+        targets = [doc for doc in self.documents.values() if matches(doc, filter)]
+        for doc in targets:
+            self._unindex(doc)
+            del self.documents[doc["_id"]]
+        return DeleteResult({"n": len(targets)}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True) -> BulkWriteResult:
+        await asyncio.sleep(0)
+        counts = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "upserted": []}
+        for index, request in enumerate(requests):
+            kind = type(request).__name__
+            spec = request._doc if kind == "InsertOne" else request._filter
+            if kind == "InsertOne":
+                await self.insert_one(spec)
+                counts["nInserted"] += 1
+            elif kind in ("UpdateOne", "UpdateMany"):
+                result = self._update(spec, request._doc, bool(request._upsert), many=kind == "UpdateMany")
+                counts["nMatched"] += result.matched_count
+                counts["nModified"] += result.modified_count
+                if result.upserted_id is not None:
+                    counts["nUpserted"] += 1
+                    counts["upserted"].append({"index": index, "_id": result.upserted_id})
+            else:
+                raise NotImplementedError(f"bulk operation {kind}")
+        return BulkWriteResult(counts, True)
+
+    def watch(self, pipeline: Optional[List[dict]] = None, resume_after=None, **kwargs) -> FakeChangeStream:
+        return FakeChangeStream(self, pipeline)
+
+    # Reads
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor(self, filter, projection)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        await asyncio.sleep(0)
+        doc = self._first(filter or {})
+        return None if doc is None else project(doc, projection)
+
+    async def count_documents(self, filter: dict) -> int:
+        await asyncio.sleep(0)
+        return sum(1 for doc in self.documents.values() if matches(doc, filter))
+
+    async def estimated_document_count(self) -> int:
+        await asyncio.sleep(0)
+        return len(self.documents)
+
+    def aggregate(self, pipeline: List[dict]) -> FakeAggregationCursor:
+        docs = list(self.documents.values())
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif op == "$group":
+                docs = _group(docs, spec)
+            elif op == "$project":
+                docs = [_project_stage(doc, spec) for doc in docs]
+            elif op == "$sort":
+                docs = _sort_docs(list(docs), _normalize_sort(spec))
+            elif op == "$limit":
+                docs = docs[:spec]
+            elif op == "$skip":
+                docs = docs[spec:]
+            elif op == "$count":
+                docs = [{spec: len(docs)}]
+            else:
+                raise NotImplementedError(f"aggregation stage {op}")
+        return FakeAggregationCursor([copy.deepcopy(doc) for doc in docs])
+
+
+def _group(docs: List[dict], spec: dict) -> List[dict]:
+    key_expr = spec["_id"]
+    accumulators = {field: next(iter(acc.items())) for field, acc in spec.items() if field != "_id"}
+    groups: Dict[Any, dict] = {}
+    counts: Dict[Any, int] = {}
+    for doc in docs:
+        key = evaluate(key_expr, doc)
+        hashable = repr(key)
+        group = groups.get(hashable)
+        if group is None:
+            group = groups[hashable] = {"_id": key}
+            counts[hashable] = 0
+        counts[hashable] += 1
+        for field, (op, expr) in accumulators.items():
+            value = evaluate(expr, doc)
+            if op in ("$sum", "$avg"):
+                group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op == "$min":
+                group[field] = value if field not in group else min(group[field], value)
+            elif op == "$max":
+                group[field] = value if field not in group else max(group[field], value)
+            elif op == "$first":
+                group.setdefault(field, value)
+            elif op == "$last":
+                group[field] = value
+            elif op == "$push":
+                group.setdefault(field, []).append(value)
+            else:
+                raise NotImplementedError(f"accumulator {op}")
+    for hashable, group in groups.items():
+        for field, (op, _) in accumulators.items():
+            if op == "$avg":
+                group[field] = group[field] / counts[hashable]
+    return list(groups.values())
+
+
+def _project_stage(doc: dict, spec: dict) -> dict:
+    result = {} if any(value not in (0, False) for key, value in spec.items() if key != "_id") else dict(doc)
+    if spec.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    for key, value in spec.items():
+        if value in (0, False):
+            result.pop(key, None)
+        elif value in (1, True):
+            if key in doc:
+                result[key] = doc[key]
+        elif key != "_id":
+            result[key] = evaluate(value, doc)
+    return result
+
+
+class FakeDatabase:
+    def __init__(self, name: str = "test_database"):
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self._collections)
@@ -0,0 +1,14 @@
+class RecordingWebSocket:
+    """Accepts everything and keeps the frames sent to it"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.frames.append(message)
+
+    async def close(self, code=1000):
+        pass
@@ -0,0 +1,27 @@
+import asyncio
+
+import server
+
+
+def test_dashboard_reads_snapshot_kept_current_by_writes(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "admin_stats", server.AdminStats())
+    monkeypatch.setattr(server, "bans", server.BanList())
+    monkeypatch.setattr(server, "user_cache", server.UserCache())
+    asyncio.run(server.create_user(server.UserCreate(username="ann", role="viewer")))
+    counts = []
+    count = fake_db.users.count_documents
+    monkeypatch.setattr(fake_db.users, "count_documents", lambda *args: counts.append(args) or count(*args))
+
+    async def scenario():
+        before = await server.get_admin_stats()
+        user = await server.create_user(server.UserCreate(username="bob", role="viewer"))
+        await server.ban_user(user.id, admin_id="admin")
+        return before, await server.get_admin_stats()
+
+    before, after = asyncio.run(scenario())
+
+    assert (before["total_users"], before["banned_users"]) == (1, 0)
+    assert (after["total_users"], after["banned_users"]) == (2, 1)
+    assert len(counts) == 1
+    asyncio.run(server.admin_stats.refresh())
+    assert asyncio.run(server.get_admin_stats()) == after
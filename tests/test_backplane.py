@@ -0,0 +1,160 @@
+import asyncio
+import json
+
+import server
+from tests.fake_motor import FakeDatabase
+from tests.fake_websocket import RecordingWebSocket
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_broadcast_reaches_viewers_on_every_worker():
+    async def scenario():
+        broker = FakeDatabase().broadcasts
+        workers = [server.ConnectionManager(server.MongoChangeStreamBackplane(broker)) for _ in range(3)]
+        viewers, bystanders = [], []
+        for worker in workers:
+            await worker.start()
+            viewer, bystander = RecordingWebSocket(), RecordingWebSocket()
+            await worker.connect(viewer, "comp-1")
+            await worker.connect(bystander, "comp-2")
+            viewers.append(viewer)
+            bystanders.append(bystander)
+        await settle()
+
+        await workers[0].broadcast_to_room('{"type":"new_vote"}', "comp-1")
+        await workers[2].broadcast_to_all('{"type":"notice"}')
+        await settle()
+
+        for worker in workers:
+            await worker.close()
+        return viewers, bystanders
+
+    viewers, bystanders = asyncio.run(scenario())
+
+    # Frames from different publishers may interleave differently on each worker,
+    # but each worker numbers a room's frames in the order it delivers them
+    for viewer in viewers:
+        frames = [json.loads(frame) for frame in viewer.frames]
+        assert [frame["seq"] for frame in frames] == [1, 2]
+        assert sorted(frame["type"] for frame in frames) == ["new_vote", "notice"]
+    for bystander in bystanders:
+        assert bystander.frames == ['{"seq":1,"type":"notice"}']
+
+
+def test_in_memory_backplane_stays_in_process():
+    async def scenario():
+        first, second = server.ConnectionManager(), server.ConnectionManager()
+        viewer, other_worker_viewer = RecordingWebSocket(), RecordingWebSocket()
+        await first.connect(viewer, "comp-1")
+        await second.connect(other_worker_viewer, "comp-1")
+        await first.broadcast_to_room('{"type":"new_message"}', "comp-1")
+        await settle()
+        return viewer, other_worker_viewer
+
+    viewer, other_worker_viewer = asyncio.run(scenario())
+
+    assert viewer.frames == ['{"seq":1,"type":"new_message"}']
+    assert other_worker_viewer.frames == []
+
+
+def test_leaderboard_totals_follow_votes_stored_by_other_workers(fake_db, monkeypatch):
+    async def scenario():
+        broker = FakeDatabase().broadcasts
+        caches = [server.LeaderboardCache(), server.LeaderboardCache()]
+        workers = [server.ConnectionManager(server.MongoChangeStreamBackplane(broker)) for _ in caches]
+        for worker, cache in zip(workers, caches):
+            worker.on_control("vote_scored", cache.apply_changed)
+            await worker.start()
+        await settle()
+
+        async def vote(index, voter, participant, rating):
+            monkeypatch.setattr(server, "manager", workers[index])
+            monkeypatch.setattr(server, "leaderboards", caches[index])
+            await server.cast_vote(server.VoteCreate(
+                competition_id="comp-1", participant_id=participant, voter_id=voter, rating=rating
+            ))
+
+        await vote(0, "v1", "alice", 5)
+        await vote(1, "v2", "bob", 4)
+        await vote(1, "v1", "alice", 2)
+        await settle()
+        for worker in workers:
+            await worker.close()
+        return caches
+
+    caches = asyncio.run(scenario())
+
+    expected = [
+        {"participant_id": "bob", "average_rating": 4.0, "total_votes": 1},
+        {"participant_id": "alice", "average_rating": 2.0, "total_votes": 1},
+    ]
+    assert [cache.results("comp-1") for cache in caches] == [expected, expected]
+
+
+def test_reaction_totals_follow_taps_stored_by_other_workers(fake_db, monkeypatch):
+    asyncio.run(fake_db.reactions.insert_one({"competition_id": "comp-1", "participant_id": "p1", "counts": {"like": 10}}))
+
+    async def scenario():
+        broker = FakeDatabase().broadcasts
+        counters = [server.ReactionCounters(tick_seconds=60, flush_seconds=60) for _ in range(2)]
+        workers = [server.ConnectionManager(server.MongoChangeStreamBackplane(broker)) for _ in counters]
+        for worker, counter in zip(workers, counters):
+            worker.on_control("reactions_stored", counter.apply_stored)
+            await worker.start()
+        await settle()
+        for counter in counters:
+            await counter.counts("comp-1")
+
+        for index, (participant, kind, count) in enumerate([("p1", "like", 5), ("p2", "fire", 2)]):
+            monkeypatch.setattr(server, "manager", workers[index])
+            counters[index]._apply("comp-1", {(participant, kind): count})
+            await counters[index]._flush("comp-1")
+        await settle()
+        totals = [await counter.counts("comp-1") for counter in counters]
+        for worker in workers:
+            await worker.close()
+        return totals
+
+    totals = asyncio.run(scenario())
+
+    expected = {"p1": {"like": 15}, "p2": {"fire": 2}}
+    assert totals == [expected, expected]
+
+
+def test_reaction_totals_loaded_after_a_write_skip_its_late_control_message(fake_db, monkeypatch):
+    async def scenario():
+        broker = FakeDatabase().broadcasts
+        counters = [server.ReactionCounters(tick_seconds=60, flush_seconds=60) for _ in range(2)]
+        workers = [server.ConnectionManager(server.MongoChangeStreamBackplane(broker)) for _ in counters]
+        # Hold the second worker's control messages back until after its load
+        held = []
+        workers[1].on_control("reactions_stored", held.append)
+        for worker in workers:
+            await worker.start()
+        await settle()
+        await counters[1].counts("comp-1")
+
+        monkeypatch.setattr(server, "manager", workers[0])
+        counters[0]._apply("comp-1", {("p1", "like"): 5})
+        await counters[0]._flush("comp-1")
+        counters[0]._apply("comp-1", {("p1", "like"): 2, ("p2", "fire"): 1})
+        await counters[0]._flush("comp-1")
+        await settle()
+        # Loaded once more after both writes landed, then the messages arrive
+        counters[1].discard("comp-1")
+        await counters[1].counts("comp-1")
+        for payload in held:
+            counters[1].apply_stored(payload)
+        totals = await counters[1].counts("comp-1")
+        for worker in workers:
+            await worker.close()
+        return held, totals
+
+    held, totals = asyncio.run(scenario())
+
+    assert len(held) == 2
+    assert totals == {"p1": {"like": 7}, "p2": {"fire": 1}}
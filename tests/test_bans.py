@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server
+from tests.fake_motor import FakeDatabase
+from tests.fake_websocket import RecordingWebSocket
+
+
+class ClosableWebSocket(RecordingWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.closed_with = None
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+@pytest.fixture
+def client(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    monkeypatch.setattr(server, "bans", server.BanList())
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=100, flush_seconds=60))
+    monkeypatch.setattr(server, "participant_cache", server.ParticipantCache())
+    server.bans.set_banned("banned", True)
+    asyncio.run(fake_db.competitions.insert_one(
+        server.Competition(id="comp-1", title="Finals", description="", moderator_id="m1", participants=["p1"]).dict()
+    ))
+    asyncio.run(fake_db.live_voting.insert_one(
+        server.LiveVotingSession(id="s1", competition_id="comp-1", question="Who?", options=["p1"], votes={"p1": 0}).dict()
+    ))
+    return TestClient(server.app)
+
+
+@pytest.mark.parametrize("method, url, params, body", [
+    ("POST", "/api/votes", None, {"competition_id": "comp-1", "participant_id": "p1", "voter_id": "banned", "rating": 5}),
+    ("POST", "/api/voting/submit", None, {"voting_session_id": "s1", "voter_id": "banned", "selected_option": "p1"}),
+    ("POST", "/api/messages", None, {"competition_id": "comp-1", "user_id": "banned", "username": "b", "message": "hi"}),
+    ("POST", "/api/competitions/comp-1/join", {"user_id": "banned"}, None),
+    ("POST", "/api/reactions", None, {"competition_id": "comp-1", "participant_id": "p1", "user_id": "banned"}),
+])
+def test_banned_user_gets_403_on_every_write(fake_db, client, method, url, params, body):
+    response = client.request(method, url, params=params, json=body)
+
+    assert response.status_code == 403
+    assert response.json()["detail"] == "User is banned"
+    assert fake_db.votes.documents == {}
+    assert fake_db.live_voting_ballots.documents == {}
+    assert server.chat_ingest.pending == {}
+    assert server.reactions.pending.get("comp-1") is None
+
+
+def test_batch_leaves_out_banned_users_messages(client):
+    response = client.post("/api/messages/batch", json=[
+        {"competition_id": "comp-1", "user_id": user_id, "username": user_id, "message": "hi"}
+        for user_id in ("banned", "fan")
+    ])
+
+    assert response.status_code == 200
+    assert [message["user_id"] for message in response.json()] == ["fan"]
+    assert [message.user_id for message in server.chat_ingest.pending["comp-1"]] == ["fan"]
+
+
+def test_banned_user_websocket_is_closed_with_4403(client):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/ws/comp-1?user_id=banned") as websocket:
+            websocket.receive_text()
+
+    assert exc.value.code == server.WS_CLOSE_BANNED
+    assert server.manager.active_connections == {}
+
+
+def test_ban_from_another_worker_applies_and_drops_sockets(fake_db, monkeypatch):
+    async def scenario():
+        broker = FakeDatabase().broadcasts
+        workers = [server.ConnectionManager(server.MongoChangeStreamBackplane(broker)) for _ in range(2)]
+        ban_lists = [server.BanList(), server.BanList()]
+        workers[1].on_control("user_ban_changed", ban_lists[1].apply_changed)
+        for worker in workers:
+            await worker.start()
+        socket, bystander = ClosableWebSocket(), ClosableWebSocket()
+        await workers[1].connect(socket, "comp-1", "troll")
+        await workers[1].connect(bystander, "comp-1", "fan")
+        # The handler runs on the second worker, where the module globals are its own
+        monkeypatch.setattr(server, "manager", workers[1])
+        monkeypatch.setattr(server, "bans", ban_lists[1])
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+        await workers[0].publish_control("user_ban_changed", user_id="troll", banned=True)
+        for _ in range(20):
+            await asyncio.sleep(0)
+        for worker in workers:
+            await worker.close()
+        return workers[1], ban_lists[1], socket, bystander
+
+    worker, bans, socket, bystander = asyncio.run(scenario())
+
+    assert bans.is_banned("troll")
+    assert socket.closed_with == server.WS_CLOSE_BANNED
+    assert bystander.closed_with is None
+    assert [client.user_id for client in worker.active_connections.values()] == ["fan"]
+    with pytest.raises(server.HTTPException) as exc:
+        bans.ensure_allowed("troll")
+    assert exc.value.status_code == 403
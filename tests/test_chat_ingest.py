@@ -0,0 +1,202 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect
+
+import server
+from tests.fake_websocket import RecordingWebSocket
+
+
+@pytest.fixture
+def room(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    return RecordingWebSocket()
+
+
+def chat(text, competition_id="comp-1"):
+    return server.MessageCreate(competition_id=competition_id, user_id="u1", username="viewer", message=text)
+
+
+def frames(websocket):
+    return [json.loads(frame) for frame in websocket.frames]
+
+
+def test_size_threshold_flushes_one_insert_and_one_frame(fake_db, room, monkeypatch):
+    buffer = server.ChatIngestBuffer(flush_size=3, flush_seconds=60)
+    monkeypatch.setattr(server, "chat_ingest", buffer)
+
+    async def scenario():
+        await server.manager.connect(room, "comp-1")
+        await server.send_messages([chat("one"), chat("two")])
+        await asyncio.sleep(0.01)
+        assert fake_db.messages.documents == {}
+        await server.send_message(chat("three"))
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert [doc["message"] for doc in fake_db.messages.documents.values()] == ["one", "two", "three"]
+    assert [frame["type"] for frame in frames(room)] == ["new_messages"]
+    assert [message["message"] for message in frames(room)[0]["messages"]] == ["one", "two", "three"]
+
+
+def test_single_worker_flush_publishes_no_control_message(fake_db, room, monkeypatch):
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=1, flush_seconds=60))
+    backplane = server.manager.backplane
+    published = []
+    publish = backplane.publish
+    monkeypatch.setattr(backplane, "publish", lambda room_id, *args: published.append(room_id) or publish(room_id, *args))
+
+    async def scenario():
+        await server.manager.connect(room, "comp-1")
+        await server.send_message(chat("one"))
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert published == ["comp-1"]
+    assert [frame["type"] for frame in frames(room)] == ["new_messages"]
+
+
+def test_time_threshold_flushes_each_competition(fake_db, room, monkeypatch):
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=100, flush_seconds=0.02))
+
+    async def scenario():
+        await server.send_message(chat("hello", "comp-1"))
+        await server.send_message(chat("hi", "comp-2"))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert sorted(doc["competition_id"] for doc in fake_db.messages.documents.values()) == ["comp-1", "comp-2"]
+    assert server.chat_ingest.pending == {}
+
+
+def test_shutdown_flushes_everything_buffered_and_refuses_new_messages(fake_db, room, monkeypatch):
+    buffer = server.ChatIngestBuffer(flush_size=100, flush_seconds=60)
+    monkeypatch.setattr(server, "chat_ingest", buffer)
+
+    async def scenario():
+        await server.send_messages([chat(f"line {index}") for index in range(10)])
+        await buffer.close()
+        with pytest.raises(HTTPException) as refused:
+            await server.send_message(chat("too late"))
+        return refused.value.status_code
+
+    assert asyncio.run(scenario()) == 503
+    assert len(fake_db.messages.documents) == 10
+    assert (buffer.flushed, buffer.dropped) == (10, 0)
+
+
+def test_failed_writes_are_retried_then_dropped(fake_db, room, monkeypatch):
+    buffer = server.ChatIngestBuffer(flush_size=100, flush_seconds=0.01, max_retries=2)
+    monkeypatch.setattr(server, "chat_ingest", buffer)
+    insert_many = fake_db.messages.insert_many
+    failures = {"left": 1}
+
+    async def flaky_insert_many(documents, ordered=True):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise AutoReconnect("primary stepped down")
+        return await insert_many(documents, ordered=ordered)
+
+    monkeypatch.setattr(fake_db.messages, "insert_many", flaky_insert_many)
+
+    async def scenario():
+        await server.send_message(chat("survives one failure"))
+        await asyncio.sleep(0.1)
+        failures["left"] = 10
+        await server.send_message(chat("never stored"))
+        await buffer.close()
+
+    asyncio.run(scenario())
+
+    assert [doc["message"] for doc in fake_db.messages.documents.values()] == ["survives one failure"]
+    assert (buffer.flushed, buffer.dropped) == (1, 1)
+
+
+def test_recent_chat_serves_joins_from_memory(fake_db, room, monkeypatch):
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=100, flush_seconds=0.01))
+    monkeypatch.setattr(server, "recent_chat", server.RecentChat(size=5))
+    for index in range(3):
+        message = server.ChatMessage(**chat(f"old {index}").dict())
+        message.timestamp = message.timestamp.replace(year=2020, microsecond=index * 1000)
+        asyncio.run(fake_db.messages.insert_one(message.dict()))
+    queries = []
+    find = fake_db.messages.find
+    monkeypatch.setattr(fake_db.messages, "find", lambda *args, **kwargs: queries.append(args) or find(*args, **kwargs))
+
+    def texts(response):
+        return [message["message"] for message in response.json()]
+
+    async def scenario():
+        await server.send_messages([chat(f"new {index}") for index in range(4)])
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    client = TestClient(server.app)
+    url = "/api/competitions/comp-1/messages"
+    first_join = client.get(url, params={"limit": 5})
+    second_join = client.get(url, params={"limit": 2})
+    tail_page = client.get(url, params={"limit": 3})
+    earlier = client.get(url, params={"limit": 10, "before": tail_page.headers["X-Before-Cursor"]})
+
+    # The batch shares a millisecond, so like MongoDB the buffer orders it by id
+    new = [doc["message"] for doc in sorted(fake_db.messages.documents.values(), key=lambda doc: (doc["timestamp"], doc["id"]))][3:]
+    assert texts(first_join) == ["old 2", *new]
+    assert texts(second_join) == new[2:]
+    assert texts(earlier) == ["old 0", "old 1", "old 2", new[0]]
+    assert "X-Before-Cursor" not in earlier.headers
+    # One query to warm the room, one for the page before the in-memory tail
+    assert len(queries) == 2
+
+
+def test_before_cursor_from_memory_matches_stored_timestamps(fake_db, room, monkeypatch):
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=100, flush_seconds=0.01))
+    monkeypatch.setattr(server, "recent_chat", server.RecentChat(size=5))
+    insert_many = fake_db.messages.insert_many
+
+    def insert_like_mongo(documents, **kwargs):
+        # MongoDB keeps datetimes to the millisecond
+        stored = [
+            {**doc, "timestamp": doc["timestamp"].replace(microsecond=doc["timestamp"].microsecond // 1000 * 1000)}
+            for doc in documents
+        ]
+        return insert_many(stored, **kwargs)
+
+    monkeypatch.setattr(fake_db.messages, "insert_many", insert_like_mongo)
+
+    async def scenario():
+        # Several messages share a millisecond, so ties are broken by id
+        for index in range(10):
+            await server.send_message(chat(f"m{index}"))
+            if index % 3 == 2:
+                await asyncio.sleep(0.002)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    client = TestClient(server.app)
+    url = "/api/competitions/comp-1/messages"
+    latest = client.get(url, params={"limit": 5})
+    earlier = client.get(url, params={"limit": 5, "before": latest.headers["X-Before-Cursor"]})
+
+    stored = sorted(fake_db.messages.documents.values(), key=lambda doc: (doc["timestamp"], doc["id"]))
+    assert [message["id"] for message in earlier.json() + latest.json()] == [doc["id"] for doc in stored]
+
+
+def test_recent_chat_keeps_only_recently_used_rooms_with_messages(fake_db):
+    for competition_id in ("comp-1", "comp-2", "comp-3"):
+        message = server.ChatMessage(**chat("hi", competition_id).dict())
+        asyncio.run(fake_db.messages.insert_one(message.dict()))
+    recent = server.RecentChat(size=5, max_rooms=2)
+
+    async def scenario():
+        for competition_id in ("comp-1", "comp-2", "missing-1", "missing-2", "comp-1", "comp-3"):
+            await recent.latest(competition_id, 5)
+
+    asyncio.run(scenario())
+
+    assert list(recent.rooms) == ["comp-1", "comp-3"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.fixture
+def competition(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "bans", server.BanList())
+    comp = asyncio.run(server.create_competition(
+        server.CompetitionCreate(title="Finals", description="", moderator_id="mod")
+    ))
+    return comp.id
+
+
+def test_concurrent_joins_fill_exactly_to_capacity(fake_db, competition):
+    asyncio.run(fake_db.competitions.update_one({"id": competition}, {"$set": {"max_participants": 50}}))
+
+    async def join(user_id):
+        try:
+            return await server.join_competition(competition, user_id)
+        except HTTPException as exc:
+            return exc.status_code
+
+    async def scenario():
+        # 300 users, each tapping join twice at the same time
+        users = [f"user-{index}" for index in range(300)]
+        results = await asyncio.gather(*(join(user_id) for user_id in users + users))
+        return list(zip(users + users, results))
+
+    results = asyncio.run(scenario())
+
+    comp = asyncio.run(fake_db.competitions.find_one({"id": competition}))
+    assert len(comp["participants"]) == 50
+    assert len(set(comp["participants"])) == 50
+    joined = {user_id for user_id, result in results if isinstance(result, dict)}
+    assert joined == set(comp["participants"])
+    assert all(result == 400 for user_id, result in results if user_id not in joined)
+    assert max(result["participant_count"] for _, result in results if isinstance(result, dict)) == 50
+
+
+def test_join_unknown_competition_is_404(fake_db, competition):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.join_competition("missing", "user-1"))
+    assert exc.value.status_code == 404
+
+
+def test_start_and_end_follow_the_state_machine(fake_db, competition):
+    asyncio.run(server.join_competition(competition, "user-1"))
+
+    async def transition(action):
+        try:
+            return (await action(competition))["message"]
+        except HTTPException as exc:
+            return exc.status_code
+
+    assert asyncio.run(transition(server.end_competition)) == 409
+    assert asyncio.run(transition(server.start_competition)) == "Competition started"
+    assert asyncio.run(transition(server.start_competition)) == 409
+    assert asyncio.run(transition(server.end_competition)) == "Competition ended"
+    assert asyncio.run(transition(server.start_competition)) == 409
+
+    comp = asyncio.run(fake_db.competitions.find_one({"id": competition}))
+    assert comp["status"] == "ended"
+    assert comp["participants"] == ["user-1"]
+    assert comp["start_time"] <= comp["end_time"]
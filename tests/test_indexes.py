@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+START = datetime(2026, 1, 1)
+
+
+def test_duplicate_votes_keep_the_latest_before_the_unique_index(fake_db):
+    for minute, (voter, rating) in enumerate([("v1", 2), ("v2", 3), ("v1", 5), ("v1", 4)]):
+        vote = server.Vote(competition_id="comp-1", participant_id="alice", voter_id=voter, rating=rating,
+                           timestamp=START + timedelta(minutes=minute))
+        asyncio.run(fake_db.votes.insert_one(vote.dict()))
+
+    asyncio.run(server.create_indexes())
+
+    ratings = {vote["voter_id"]: vote["rating"] for vote in fake_db.votes.documents.values()}
+    assert ratings == {"v1": 4, "v2": 3}
+    assert any(index["unique"] for index in fake_db.votes.indexes.values() if len(index["key"]) == 3)
+
+
+def test_duplicate_ballots_keep_the_first_and_uncount_the_rest(fake_db):
+    asyncio.run(fake_db.live_voting.insert_one(server.LiveVotingSession(
+        id="s1", competition_id="comp-1", question="Who?", options=["a", "b"], votes={"a": 2, "b": 1}
+    ).dict()))
+    for minute, option in enumerate(["a", "b", "a"]):
+        asyncio.run(fake_db.live_voting_ballots.insert_one({
+            "voting_session_id": "s1", "voter_id": "v1", "selected_option": option,
+            "timestamp": START + timedelta(minutes=minute)
+        }))
+
+    asyncio.run(server.create_indexes())
+
+    ballots = [ballot["selected_option"] for ballot in fake_db.live_voting_ballots.documents.values()]
+    session = asyncio.run(fake_db.live_voting.find_one({"id": "s1"}))
+    assert ballots == ["a"]
+    assert session["votes"] == {"a": 1, "b": 0}
+
+
+def test_startup_fails_when_the_voter_index_cannot_be_built(fake_db, monkeypatch):
+    async def refuse(indexes):
+        raise server.PyMongoError("index build failed")
+
+    monkeypatch.setattr(fake_db.votes, "create_indexes", refuse)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.create_indexes())
+
+
+def test_duplicates_are_only_looked_for_when_the_index_build_hits_them(fake_db, monkeypatch):
+    aggregations = []
+    for collection in (fake_db.votes, fake_db.live_voting_ballots):
+        aggregate = collection.aggregate
+        monkeypatch.setattr(collection, "aggregate", lambda pipeline, aggregate=aggregate: aggregations.append(pipeline) or aggregate(pipeline))
+
+    asyncio.run(server.create_indexes())
+    asyncio.run(server.create_indexes())
+
+    assert aggregations == []
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.fake_websocket import RecordingWebSocket
+
+
+@pytest.fixture
+def session(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    monkeypatch.setattr(server, "bans", server.BanList())
+    monkeypatch.setattr(server, "voting_tallies", server.VotingTallyAggregator())
+    asyncio.run(server.create_indexes())
+    asyncio.run(fake_db.competitions.insert_one(
+        server.Competition(id="comp-1", title="Finals", description="", moderator_id="m1", voting_tick_ms=20).dict()
+    ))
+    create = server.LiveVotingCreate(competition_id="comp-1", question="Who wins?", options=["a", "b", "c"])
+    return asyncio.run(server.create_voting_session(create))
+
+
+def submit(session, voter, option="a"):
+    return server.submit_live_vote(server.LiveVoteSubmit(voting_session_id=session.id, voter_id=voter, selected_option=option))
+
+
+def stored_votes(fake_db, session):
+    return asyncio.run(fake_db.live_voting.find_one({"id": session.id}))["votes"]
+
+
+def test_repeat_voter_is_rejected(fake_db, session):
+    async def scenario():
+        await submit(session, "v1", "a")
+        await submit(session, "v1", "b")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+
+    assert (exc.value.status_code, exc.value.detail) == (400, "User has already voted")
+    assert stored_votes(fake_db, session) == {"a": 1, "b": 0, "c": 0}
+    assert len(fake_db.live_voting_ballots.documents) == 1
+
+
+def test_rejected_vote_gives_its_ballot_back(fake_db, session):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(submit(session, "v1", "z"))
+    assert (exc.value.status_code, exc.value.detail) == (400, "Invalid voting option")
+    assert fake_db.live_voting_ballots.documents == {}
+
+    asyncio.run(server.end_voting_session(session.id))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(submit(session, "v1", "a"))
+    assert (exc.value.status_code, exc.value.detail) == (400, "Voting session is not active")
+    assert fake_db.live_voting_ballots.documents == {}
+    assert stored_votes(fake_db, session) == {"a": 0, "b": 0, "c": 0}
+
+
+def test_concurrent_votes_are_counted_exactly(fake_db, session):
+    async def scenario():
+        # Every voter taps twice at once; only one of the two may count
+        attempts = [submit(session, f"v{index}", "ab"[index % 2]) for index in range(100) for _ in range(2)]
+        return await asyncio.gather(*attempts, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(rejected) == 100
+    assert all(result.status_code == 400 for result in rejected)
+    assert stored_votes(fake_db, session) == {"a": 50, "b": 50, "c": 0}
+    assert len(fake_db.live_voting_ballots.documents) == 100
+
+
+def test_each_tick_sends_one_update_with_only_the_changed_options(fake_db, session):
+    viewer = RecordingWebSocket()
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1")
+        await asyncio.gather(*(submit(session, f"v{index}", "a") for index in range(5)))
+        await asyncio.sleep(0.06)
+        await submit(session, "v5", "c")
+        await asyncio.sleep(0.06)
+        server.voting_tallies.close()
+
+    asyncio.run(scenario())
+
+    updates = [frame for frame in map(json.loads, viewer.frames) if frame["type"] == "voting_update"]
+    assert [update["updates"] for update in updates] == [
+        [{"voting_session_id": session.id, "votes": {"a": 5}}],
+        [{"voting_session_id": session.id, "votes": {"c": 1}}],
+    ]
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def rule(pattern, action="mask", is_regex=False):
+    return server.ModerationRule(pattern=pattern, action=action, is_regex=is_regex, created_by="admin")
+
+
+@pytest.fixture
+def moderation(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    filter = server.ModerationFilter()
+    monkeypatch.setattr(server, "moderation", filter)
+    return filter
+
+
+def test_words_and_phrases_mask_or_block_ignoring_case():
+    filter = server.ModerationFilter([
+        rule("darn"),
+        rule("scam"),
+        rule("buy followers", action="block"),
+        rule("go away now"),
+        rule("Spoiler", action="block"),
+    ])
+
+    assert filter.check("what a DARN good round") == (False, "what a **** good round")
+    assert filter.check("Scam scammer") == (False, "**** scammer")
+    assert filter.check("cheap way to BUY   followers here") == (True, "cheap way to BUY   followers here")
+    assert filter.check("buy more followers") == (False, "buy more followers")
+    assert filter.check("please go away, now") == (False, "please " + "*" * len("go away, now"))
+    assert filter.check("no spoilers please")[0] is False
+    assert filter.check("big spoiler ahead")[0] is True
+    assert filter.check("all clean here") == (False, "all clean here")
+
+
+def test_regex_rules_mask_and_block():
+    filter = server.ModerationFilter([
+        rule(r"\d{3}-\d{4}", is_regex=True),
+        rule(r"(x)y", is_regex=True),
+        rule(r"fr[e3]{2}\s*coins", action="block", is_regex=True),
+    ])
+
+    assert filter.check("call 555-1234 now") == (False, "call ******** now")
+    assert filter.check("XY marks the spot") == (False, "** marks the spot")
+    assert filter.check("get FR33 coins")[0] is True
+
+
+def test_rules_that_cannot_be_combined_are_skipped_on_load():
+    filter = server.ModerationFilter([
+        rule("(?i)spam", is_regex=True),
+        rule(r"(a)\1", is_regex=True),
+        rule(r"(?P<word>bad)", is_regex=True),
+        rule("spam"),
+    ])
+
+    assert filter.rule_count == 1
+    assert filter.check("spam aa bad") == (False, "**** aa bad")
+
+
+@pytest.mark.parametrize("pattern", ["(?i)spam", r"(a)\1", r"(?P<n>a)(?P=n)", "(unclosed"])
+def test_rule_that_cannot_be_combined_is_rejected(fake_db, moderation, pattern):
+    create = server.ModerationRuleCreate(pattern=pattern, is_regex=True)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.add_moderation_rule(create, admin_id="admin"))
+
+    assert exc.value.status_code == 400
+    assert fake_db.moderation_rules.documents == {}
+
+
+def test_reload_skips_bad_stored_rules(fake_db, moderation):
+    asyncio.run(fake_db.moderation_rules.insert_one(rule("(?i)spam", is_regex=True).dict()))
+    asyncio.run(server.add_moderation_rule(server.ModerationRuleCreate(pattern=r"spam+", is_regex=True), admin_id="admin"))
+
+    assert moderation.rule_count == 1
+    assert moderation.check("spammm") == (False, "******")
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "admin_stats", server.AdminStats())
+    for index in range(5):
+        asyncio.run(server.create_user(server.UserCreate(username=f"user{index}", role="viewer")))
+    return TestClient(server.app)
+
+
+def pages(client, url, **params):
+    """Follow X-Next-Cursor from the first page to the last"""
+    result = []
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        result.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return result
+        params["after"] = cursor
+
+
+def test_fields_pages_keep_their_cursor(client):
+    result = pages(client, "/api/users", limit=2, fields="username")
+
+    assert [[user["username"] for user in page] for page in result] == [
+        ["user0", "user1"], ["user2", "user3"], ["user4"]
+    ]
+    assert all(set(user) == {"username"} for page in result for user in page)
+
+
+def test_ndjson_with_fields_streams_only_those_fields(client):
+    response = client.get("/api/users", params={"format": "ndjson", "fields": "username"})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert lines == [{"username": f"user{index}"} for index in range(5)]
+
+
+def test_pages_chain_without_gaps_or_repeats(client):
+    result = pages(client, "/api/users", limit=2)
+
+    assert [len(page) for page in result] == [2, 2, 1]
+    usernames = [user["username"] for page in result for user in page]
+    assert usernames == [f"user{index}" for index in range(5)]
+
+
+def test_exact_last_page_ends_with_an_empty_page(client):
+    result = pages(client, "/api/users", limit=5)
+
+    assert [len(page) for page in result] == [5, 0]
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "bm9wZQ==", "WzEsMl0="])
+def test_bad_cursor_is_400(client, cursor):
+    response = client.get("/api/users", params={"after": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid page cursor"
+
+
+def test_ndjson_streams_the_rest_from_a_cursor(client):
+    first = client.get("/api/users", params={"limit": 2})
+    response = client.get("/api/users", params={"format": "ndjson", "after": first.headers["X-Next-Cursor"]})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["username"] for line in lines] == ["user2", "user3", "user4"]
+    assert all("_id" not in line for line in lines)
+
+
+def test_cursor_headers_are_exposed_to_browsers(client):
+    response = client.get("/api/users", params={"limit": 2}, headers={"Origin": "http://app.example"})
+
+    exposed = response.headers["access-control-expose-headers"]
+    assert "X-Next-Cursor" in exposed and "X-Before-Cursor" in exposed
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.fake_websocket import RecordingWebSocket
+
+
+@pytest.fixture
+def counters(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    monkeypatch.setattr(server, "bans", server.BanList())
+    monkeypatch.setattr(server, "participant_cache", server.ParticipantCache())
+    asyncio.run(fake_db.competitions.insert_one(
+        server.Competition(id="comp-1", title="Finals", description="", moderator_id="m1", participants=["p1", "p2"]).dict()
+    ))
+    counters = server.ReactionCounters(tick_seconds=0.01, flush_seconds=60)
+    monkeypatch.setattr(server, "reactions", counters)
+    return counters
+
+
+def tap(participant="p1", kind="like", count=1):
+    return server.ReactionCreate(competition_id="comp-1", participant_id=participant, user_id="u1", kind=kind, count=count)
+
+
+def test_taps_are_broadcast_per_tick_and_written_with_inc(fake_db, counters, monkeypatch):
+    asyncio.run(fake_db.reactions.insert_one({"competition_id": "comp-1", "participant_id": "p1", "counts": {"like": 10}}))
+    writes = []
+    bulk_write = fake_db.reactions.bulk_write
+    monkeypatch.setattr(fake_db.reactions, "bulk_write", lambda requests, **kwargs: writes.append(requests) or bulk_write(requests, **kwargs))
+    viewer = RecordingWebSocket()
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1")
+        for _ in range(500):
+            await server.add_reaction(tap())
+        await server.add_reaction(tap("p2", "fire", count=3))
+        await asyncio.sleep(0.05)
+        await server.add_reaction(tap("p2", "fire"))
+        await counters.close()
+        return await server.get_reactions("comp-1")
+
+    totals = asyncio.run(scenario())
+
+    updates = [json.loads(frame) for frame in viewer.frames]
+    assert [update["type"] for update in updates] == ["reactions_update"]
+    assert updates[0]["deltas"] == {"p1": {"like": 500}, "p2": {"fire": 3}}
+    assert updates[0]["totals"] == {"p1": {"like": 510}, "p2": {"fire": 3}}
+    assert totals == {"p1": {"like": 510}, "p2": {"fire": 4}}
+    stored = {doc["participant_id"]: doc["counts"] for doc in fake_db.reactions.documents.values()}
+    assert stored == totals
+    assert sum(len(requests) for requests in writes) <= 3
+
+
+def test_unknown_reaction_is_rejected(fake_db, counters):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.add_reaction(tap(kind="confetti")))
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("competition_id, participant_id, status_code", [
+    ("comp-2", "p1", 404),
+    ("comp-1", "p3", 400),
+])
+def test_reactions_need_a_participant_of_an_existing_competition(fake_db, counters, competition_id, participant_id, status_code):
+    create = server.ReactionCreate(competition_id=competition_id, participant_id=participant_id, user_id="u1", kind="like")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.add_reaction(create))
+
+    assert exc.value.status_code == status_code
+    assert counters.pending == {}
+
+
+def test_unknown_competition_has_no_reactions_to_load(fake_db, counters):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(server.get_reactions("comp-2"))
+
+    assert exc.value.status_code == 404
+    assert counters.totals == {}
+
+
+def test_joined_participant_can_be_reacted_to(fake_db, counters):
+    async def scenario():
+        await server.participant_cache.get("comp-1")
+        await server.join_competition("comp-1", "p3")
+        await server.add_reaction(tap("p3"))
+
+    asyncio.run(scenario())
+
+    assert counters.pending == {"comp-1": {("p3", "like"): 1}}
@@ -0,0 +1,118 @@
+import asyncio
+
+import server
+
+
+def _load_votes(collection, competition_id, per_participant):
+    """Insert votes straight into the fake store; ratings cycle through 1..5"""
+    for participant_id, count in per_participant.items():
+        for index in range(count):
+            collection.documents[(participant_id, index)] = {
+                "_id": (participant_id, index),
+                "id": f"{participant_id}-{index}",
+                "competition_id": competition_id,
+                "participant_id": participant_id,
+                "voter_id": f"voter-{index}",
+                "vote_type": "star",
+                "rating": index % 5 + 1,
+            }
+
+
+def test_results_average_every_vote_past_the_old_1000_cap(fake_db):
+    _load_votes(fake_db.votes, "comp-1", {"alice": 1000, "bob": 1001})
+    _load_votes(fake_db.votes, "comp-2", {"carol": 10})
+
+    results = asyncio.run(server.get_competition_results("comp-1"))
+
+    # Both round to 3.0, so the tie is broken by participant id
+    assert results == [
+        {"participant_id": "alice", "average_rating": 3.0, "total_votes": 1000},
+        {"participant_id": "bob", "average_rating": round(3001 / 1001, 2), "total_votes": 1001},
+    ]
+
+
+def test_results_at_ten_thousand_votes(fake_db):
+    # The fake's $group is pure Python, so this stays small; the 2001-vote test already covers the old cap
+    per_participant = {"p1": 4_000, "p2": 3_503, "p3": 2_497}
+    _load_votes(fake_db.votes, "comp-1", per_participant)
+
+    results = asyncio.run(server.get_competition_results("comp-1"))
+
+    assert sum(row["total_votes"] for row in results) == 10_000
+    by_participant = {row["participant_id"]: row for row in results}
+    for participant_id, count in per_participant.items():
+        full_cycles, rest = divmod(count, 5)
+        total = full_cycles * 15 + sum(range(1, rest + 1))
+        assert by_participant[participant_id]["total_votes"] == count
+        assert by_participant[participant_id]["average_rating"] == round(total / count, 2)
+    averages = [row["average_rating"] for row in results]
+    assert averages == sorted(averages, reverse=True)
+
+
+def test_leaderboard_cache_tracks_overwritten_votes(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "leaderboards", server.LeaderboardCache())
+    _load_votes(fake_db.votes, "comp-1", {"alice": 3, "bob": 2})
+    asyncio.run(server.leaderboards.rebuild())
+
+    async def vote(voter_id, participant_id, rating):
+        await server.cast_vote(server.VoteCreate(
+            competition_id="comp-1", participant_id=participant_id, voter_id=voter_id, rating=rating
+        ))
+
+    # A fresh vote for bob, then an existing alice voter changing 1 -> 5
+    asyncio.run(vote("voter-new", "bob", 5))
+    asyncio.run(vote("voter-0", "alice", 5))
+
+    cached = asyncio.run(server.get_competition_results("comp-1"))
+    aggregated = asyncio.run(fake_db.votes.aggregate(server.leaderboard_pipeline("comp-1")).to_list(None))
+    assert cached == aggregated
+    assert cached[0] == {"participant_id": "alice", "average_rating": round(10 / 3, 2), "total_votes": 3}
+
+
+def test_cast_vote_upserts_one_vote_per_voter(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "leaderboards", server.LeaderboardCache())
+    asyncio.run(server.create_indexes())
+    ballot = server.VoteCreate(competition_id="comp-1", participant_id="alice", voter_id="v1", rating=2)
+
+    async def double_tap():
+        return await asyncio.gather(server.cast_vote(ballot), server.cast_vote(ballot.copy(update={"rating": 4})))
+
+    first, second = asyncio.run(double_tap())
+
+    assert (first.is_new, second.is_new) == (True, False)
+    assert first.id == second.id
+    assert [vote["rating"] for vote in fake_db.votes.documents.values()] == [4]
+
+
+def test_rebuild_recounts_competitions_voted_in_meanwhile(fake_db, monkeypatch):
+    _load_votes(fake_db.votes, "comp-1", {"alice": 2})
+    _load_votes(fake_db.votes, "comp-2", {"bob": 1})
+    cache = server.LeaderboardCache()
+    aggregate = fake_db.votes.aggregate
+    late = [
+        # Stored before the count ran, so the count already has it
+        ("before", "comp-1", "alice", 5),
+        # Stored after the count ran
+        ("after", "comp-2", "bob", 4),
+    ]
+
+    def aggregate_while_votes_arrive(pipeline):
+        if late:
+            when, competition_id, participant_id, rating = late.pop(0)
+            vote = {"_id": when, "competition_id": competition_id, "participant_id": participant_id,
+                    "voter_id": when, "rating": rating}
+            if when == "before":
+                fake_db.votes.documents[when] = vote
+            cursor = aggregate(pipeline)
+            if when == "after":
+                fake_db.votes.documents[when] = vote
+            cache.apply_changed({"competition_id": competition_id, "participant_id": participant_id, "rating": rating})
+            return cursor
+        return aggregate(pipeline)
+
+    monkeypatch.setattr(fake_db.votes, "aggregate", aggregate_while_votes_arrive)
+    asyncio.run(cache.rebuild())
+
+    assert cache.scores == {"comp-1": {"alice": [1 + 2 + 5, 3]}, "comp-2": {"bob": [1 + 4, 2]}}
+    cache.apply_changed({"competition_id": "comp-2", "participant_id": "bob", "rating": 3, "previous_rating": 4})
+    assert cache.scores["comp-2"]["bob"] == [1 + 3, 2]
@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import server
+from tests.fake_websocket import RecordingWebSocket
+
+
+class StalledWebSocket(RecordingWebSocket):
+    """Never finishes a send until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed_with = None
+
+    async def send_text(self, message):
+        await self.release.wait()
+        await super().send_text(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def payloads(socket):
+    return [json.loads(frame)["n"] for frame in socket.frames]
+
+
+def test_stalled_socket_does_not_hold_up_the_room():
+    async def scenario():
+        manager = server.ConnectionManager()
+        stalled, viewers = StalledWebSocket(), [RecordingWebSocket() for _ in range(3)]
+        for socket in [stalled, *viewers]:
+            await manager.connect(socket, "comp-1")
+        manager.active_connections[stalled].max_queue = 5
+
+        for n in range(20):
+            await asyncio.wait_for(manager.broadcast_to_room(json.dumps({"n": n}), "comp-1"), timeout=1)
+        await settle()
+        pending = len(manager.active_connections[stalled]._queue)
+        return stalled, viewers, pending
+
+    stalled, viewers, pending = asyncio.run(scenario())
+
+    assert all(payloads(viewer) == list(range(20)) for viewer in viewers)
+    assert stalled.frames == []
+    assert pending == 5
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    async def scenario():
+        socket = StalledWebSocket()
+        client = server.ClientConnection(socket, "comp-1", policy=server.SEND_POLICY_DROP_OLDEST, max_queue=3)
+        client.start()
+        for n in range(6):
+            assert client.enqueue(json.dumps({"n": n}), key="tally")
+        socket.release.set()
+        await settle()
+        client.stop()
+        return socket, client
+
+    socket, client = asyncio.run(scenario())
+
+    # Keys do not merge frames under drop_oldest
+    assert payloads(socket) == [3, 4, 5]
+    assert client.dropped == 3
+
+
+def test_coalesce_replaces_keyed_frames_and_drops_the_oldest_otherwise():
+    async def scenario():
+        socket = StalledWebSocket()
+        client = server.ClientConnection(socket, "comp-1", policy=server.SEND_POLICY_COALESCE, max_queue=3)
+        client.start()
+        client.enqueue(json.dumps({"n": "first"}))
+        await settle()
+        client.enqueue(json.dumps({"n": "chat-1"}))
+        for n in range(5):
+            client.enqueue(json.dumps({"n": f"tally-{n}"}), key="tally")
+        client.enqueue(json.dumps({"n": "chat-2"}))
+        client.enqueue(json.dumps({"n": "chat-3"}))
+        socket.release.set()
+        await settle()
+        client.stop()
+        return socket, client
+
+    socket, client = asyncio.run(scenario())
+
+    # The tally kept its place in the queue but carries the latest count; chat-1 was the oldest when full
+    assert payloads(socket) == ["first", "tally-4", "chat-2", "chat-3"]
+    assert client.dropped == 1
+
+
+def test_disconnect_policy_closes_with_1013_and_leaves_the_room():
+    async def scenario():
+        manager = server.ConnectionManager()
+        stalled, viewer = StalledWebSocket(), RecordingWebSocket()
+        await manager.connect(stalled, "comp-1")
+        await manager.connect(viewer, "comp-1")
+        client = manager.active_connections[stalled]
+        client.policy = server.SEND_POLICY_DISCONNECT
+        client.max_queue = 2
+
+        for n in range(5):
+            await manager.broadcast_to_room(json.dumps({"n": n}), "comp-1")
+        await settle()
+        return manager, stalled, viewer, client
+
+    manager, stalled, viewer, client = asyncio.run(scenario())
+
+    assert stalled.closed_with == 1013
+    assert client.closed
+    assert stalled not in manager.active_connections
+    assert list(manager.rooms["comp-1"]) == [viewer]
+    assert payloads(viewer) == list(range(5))
+
+
+class BrokenWebSocket(RecordingWebSocket):
+    """Fails every send, like a socket whose peer has gone away"""
+
+    async def send_text(self, message):
+        raise RuntimeError("connection reset")
+
+
+def test_socket_that_fails_a_send_is_evicted_and_its_empty_room_removed():
+    async def scenario():
+        manager = server.ConnectionManager()
+        broken, viewer = BrokenWebSocket(), RecordingWebSocket()
+        await manager.connect(broken, "comp-1")
+        await manager.connect(viewer, "comp-2")
+
+        await manager.broadcast_to_room(json.dumps({"n": 0}), "comp-1")
+        await manager.broadcast_to_all(json.dumps({"n": 1}))
+        await settle()
+        return manager, broken, viewer
+
+    manager, broken, viewer = asyncio.run(scenario())
+
+    assert broken not in manager.active_connections
+    assert "comp-1" not in manager.rooms
+    assert list(manager.active_connections) == [viewer]
+    assert payloads(viewer) == [1]
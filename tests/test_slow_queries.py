@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import server
+
+
+def find(collection, filter, **extra):
+    return {"find": collection, "filter": filter, "lsid": {"id": object()}, **extra}
+
+
+def test_each_query_shape_is_explained_once_per_cooldown(monkeypatch):
+    explained = []
+
+    async def explain(database_name, command):
+        explained.append((database_name, command["find"], command["filter"]))
+
+    monkeypatch.setattr(server, "explain_slow_query", explain)
+    listener = server.SlowQueryListener(cooldown=0.05)
+
+    async def scenario():
+        listener.loop = asyncio.get_running_loop()
+        commands = [
+            find("votes", {"competition_id": "comp-1"}),
+            find("votes", {"competition_id": "comp-2"}, limit=10),
+            find("votes", {"competition_id": "comp-2"}),
+            find("messages", {"competition_id": "comp-1"}),
+            find("votes", {"competition_id": {"$in": ["comp-1", "comp-2"]}}),
+            find("votes", {"competition_id": {"$in": ["comp-3", "comp-4", "comp-5"]}}),
+        ]
+        for request_id, command in enumerate(commands):
+            listener.started(SimpleNamespace(command_name="find", request_id=request_id, database_name="test", command=command))
+            listener.succeeded(SimpleNamespace(command_name="find", request_id=request_id, duration_micros=server.SLOW_QUERY_MS * 2000))
+        await asyncio.sleep(0.01)
+        listener.explain("test", "find", find("votes", {"competition_id": "comp-9"}))
+        await asyncio.sleep(0.06)
+        listener.explain("test", "find", find("votes", {"competition_id": "comp-9"}))
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert explained == [
+        ("test", "votes", {"competition_id": "comp-1"}),
+        ("test", "votes", {"competition_id": "comp-2"}),
+        ("test", "messages", {"competition_id": "comp-1"}),
+        ("test", "votes", {"competition_id": {"$in": ["comp-1", "comp-2"]}}),
+        ("test", "votes", {"competition_id": "comp-9"}),
+    ]
+    assert len(listener._explained) == 1
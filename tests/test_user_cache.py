@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def users(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=3, ttl=60))
+    monkeypatch.setattr(server, "bans", server.BanList())
+    for name in ("ann", "bob", "cat", "dan"):
+        asyncio.run(server.create_user(server.UserCreate(username=name, role="viewer")))
+    return {user["username"]: user["id"] for user in fake_db.users.documents.values()}
+
+
+def test_bulk_lookup_fetches_only_misses_in_one_query(fake_db, users, monkeypatch):
+    queries = []
+    find = fake_db.users.find
+    monkeypatch.setattr(fake_db.users, "find", lambda *args, **kwargs: queries.append(args[0]) or find(*args, **kwargs))
+
+    async def scenario():
+        await server.get_user(users["ann"])
+        return await server.get_users(server.Response(), ids=f"{users['bob']},{users['ann']},missing,{users['bob']}")
+
+    found = asyncio.run(scenario())
+
+    assert [user.username for user in found] == ["bob", "ann"]
+    assert queries == [{"id": {"$in": [users["ann"]]}}, {"id": {"$in": [users["bob"], "missing"]}}]
+    stats = server.user_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+
+def test_cache_evicts_least_recently_used_and_expired(fake_db, users):
+    cache = server.user_cache
+
+    async def scenario():
+        await cache.get_many([users["ann"], users["bob"], users["cat"]])
+        await cache.get(users["ann"])
+        await cache.get(users["dan"])
+
+    asyncio.run(scenario())
+    assert list(cache.entries) == [users["cat"], users["ann"], users["dan"]]
+
+    cache.ttl = 0
+    cache.discard(users["ann"])
+    asyncio.run(cache.get(users["ann"]))
+    asyncio.run(cache.get(users["ann"]))
+    assert cache.stats()["misses"] == 6
+
+
+def test_ban_drops_cached_profile(fake_db, users):
+    asyncio.run(server.get_user(users["ann"]))
+    asyncio.run(server.ban_user(users["ann"], admin_id="admin"))
+
+    assert asyncio.run(server.get_user(users["ann"])).is_banned is True
+
+
+def test_lru_cache_drops_expired_entries_as_new_ones_arrive(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache = server.LruCache(max_size=10, ttl=5)
+    cache.put("a", 1)
+    now[0] += 3
+    cache.put("b", 2)
+    now[0] += 3
+    cache.put("c", 3)
+
+    assert list(cache) == ["b", "c"]
+    assert (cache.get("a"), cache.get("b"), cache.pop("c")) == (None, 2, 3)
+
+
+def test_single_flight_shares_one_load_and_forgets_failures():
+    calls = []
+
+    async def load(result):
+        calls.append(result)
+        await asyncio.sleep(0.01)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def scenario():
+        loads = server.SingleFlight()
+        shared = await asyncio.gather(*(loads.run("room", lambda: load("first")) for _ in range(3)))
+        with pytest.raises(ValueError):
+            await loads.run("room", lambda: load(ValueError()))
+        again = await loads.run("room", lambda: load("again"))
+        return shared, again, "room" in loads
+
+    shared, again, running = asyncio.run(scenario())
+
+    assert shared == ["first"] * 3
+    assert again == "again"
+    assert len(calls) == 3
+    assert not running
@@ -0,0 +1,191 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from tests.fake_websocket import RecordingWebSocket
+
+
+@pytest.fixture
+def viewer(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "manager", server.ConnectionManager())
+    monkeypatch.setattr(server, "bans", server.BanList())
+    monkeypatch.setattr(server, "chat_ingest", server.ChatIngestBuffer(flush_size=100, flush_seconds=0.01))
+    monkeypatch.setattr(server, "recent_chat", server.RecentChat())
+    monkeypatch.setattr(server, "room_snapshots", server.RoomSnapshots())
+    return RecordingWebSocket()
+
+
+def frames(websocket):
+    return [json.loads(frame) for frame in websocket.frames]
+
+
+def test_frames_are_routed_not_relayed(fake_db, viewer):
+    other = RecordingWebSocket()
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1", "u1")
+        await server.manager.connect(other, "comp-1", "u2")
+        buckets = {}
+        for data in (
+            "not json",
+            json.dumps({"type": "shout", "message": "hi"}),
+            json.dumps({"type": "chat", "message": "x" * server.WS_MAX_FRAME_BYTES}),
+            json.dumps({"type": "vote", "rating": 5}),
+            json.dumps({"type": "chat", "username": "ann", "message": "hello"}),
+        ):
+            await server.handle_ws_frame(viewer, "comp-1", "u1", data, buckets)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+
+    errors = [frame["code"] for frame in frames(viewer) if frame["type"] == "error"]
+    assert errors == ["unknown_type", "unknown_type", "too_large", "invalid"]
+    assert [frame["type"] for frame in frames(other)] == ["new_messages"]
+    assert [doc["user_id"] for doc in fake_db.messages.documents.values()] == ["u1"]
+
+
+def test_token_bucket_limits_each_type_per_connection(fake_db, viewer):
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1")
+        buckets = {}
+        for _ in range(4):
+            await server.handle_ws_frame(viewer, "comp-1", None, json.dumps({"type": "resync"}), buckets)
+        await server.handle_ws_frame(viewer, "comp-1", None, json.dumps({"type": "chat", "username": "a", "message": "b"}), buckets)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert [frame.get("code", frame["type"]) for frame in frames(viewer)] == [
+        "snapshot", "snapshot", "rate_limited", "rate_limited", "unauthenticated"
+    ]
+
+
+def test_frame_limit_counts_bytes_and_rejections_are_rate_limited(fake_db, viewer):
+    # Fits the limit in characters but not in UTF-8 bytes
+    wide = json.dumps({"type": "chat", "username": "ann", "message": "é" * (server.WS_MAX_FRAME_BYTES // 2)}, ensure_ascii=False)
+    assert len(wide) <= server.WS_MAX_FRAME_BYTES
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1", "u1")
+        buckets = {}
+        await server.handle_ws_frame(viewer, "comp-1", "u1", wide, buckets)
+        for _ in range(20):
+            await server.handle_ws_frame(viewer, "comp-1", "u1", "garbage", buckets)
+        await server.handle_ws_frame(viewer, "comp-1", "u1", json.dumps({"type": "resync"}), buckets)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    codes = [frame.get("code", frame["type"]) for frame in frames(viewer)]
+    assert codes == ["too_large"] + ["unknown_type"] * (server.WS_REJECTED_FRAME_BURST - 1) + ["snapshot"]
+    assert fake_db.messages.documents == {}
+
+
+def test_reconnect_replays_missed_frames_or_falls_back_to_snapshot(fake_db, viewer):
+    server.manager.event_logs["comp-1"] = server.RoomEventLog(size=3)
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1")
+        for index in range(5):
+            await server.manager.broadcast_to_room(server.encode_event("tick", n=index), "comp-1")
+        await asyncio.sleep(0.01)
+        server.manager.disconnect(viewer)
+        epoch = server.manager.node_id
+        resumed, behind, moved, unknown = (RecordingWebSocket() for _ in range(4))
+        outcomes = [
+            await server.manager.connect(resumed, "comp-1", since=3, epoch=epoch),
+            await server.manager.connect(behind, "comp-1", since=1, epoch=epoch),
+            await server.manager.connect(moved, "comp-1", since=3, epoch="another-worker"),
+            await server.manager.connect(unknown, "comp-1", since=3),
+        ]
+        await asyncio.sleep(0.01)
+        return outcomes, resumed
+
+    outcomes, resumed = asyncio.run(scenario())
+
+    assert [frame["seq"] for frame in frames(viewer)] == [1, 2, 3, 4, 5]
+    assert outcomes == [True, False, False, False]
+    assert [(frame["seq"], frame["n"]) for frame in frames(resumed)] == [(4, 3), (5, 4)]
+
+
+def test_join_storm_shares_one_snapshot_build(fake_db, viewer, monkeypatch):
+    competition = asyncio.run(server.create_competition(
+        server.CompetitionCreate(title="Finals", description="", moderator_id="mod")
+    ))
+    viewers = [RecordingWebSocket() for _ in range(200)]
+    get_voting_snapshot = server.get_voting_snapshot
+
+    async def scenario():
+        building = asyncio.Event()
+
+        async def slow_voting_snapshot(competition_id):
+            await building.wait()
+            return await get_voting_snapshot(competition_id)
+
+        monkeypatch.setattr(server, "get_voting_snapshot", slow_voting_snapshot)
+        joins = asyncio.gather(*(
+            server.manager.connect(websocket, competition.id, snapshot=server.room_snapshots.get)
+            for websocket in viewers
+        ))
+        await asyncio.sleep(0.01)
+        # A frame delivered while the snapshot is being built reaches every viewer exactly once, after it
+        await server.manager.broadcast_to_room(server.encode_event("tick"), competition.id)
+        building.set()
+        await joins
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert server.room_snapshots.builds == 1
+    for websocket in viewers:
+        received = frames(websocket)
+        assert [frame["type"] for frame in received] == ["snapshot", "tick"]
+        assert received[0]["competition"]["title"] == "Finals"
+        assert received[0]["seq"] == 0 and received[1]["seq"] == 1
+
+
+def test_snapshots_are_not_kept_for_made_up_rooms_or_past_their_reuse(fake_db, viewer, monkeypatch):
+    monkeypatch.setattr(server, "reactions", server.ReactionCounters())
+    monkeypatch.setattr(server, "room_snapshots", server.RoomSnapshots(reuse_seconds=0.02))
+    competitions = [
+        asyncio.run(server.create_competition(server.CompetitionCreate(title=title, description="", moderator_id="mod")))
+        for title in ("Heats", "Finals")
+    ]
+
+    async def scenario():
+        await server.manager.connect(viewer, "made-up", snapshot=server.room_snapshots.get)
+        await server.room_snapshots.get(competitions[0].id)
+        await asyncio.sleep(0.03)
+        await server.room_snapshots.get(competitions[1].id)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+
+    assert frames(viewer)[0]["competition"] is None
+    assert list(server.room_snapshots._latest) == [competitions[1].id]
+    assert set(server.reactions.totals) == {competition.id for competition in competitions}
+
+
+def test_event_log_outlives_an_empty_room_only_for_the_grace_period(fake_db, viewer):
+    server.manager.event_log_grace = 0.02
+
+    async def scenario():
+        await server.manager.connect(viewer, "comp-1")
+        await server.manager.broadcast_to_room(server.encode_event("tick"), "comp-1")
+        server.manager.disconnect(viewer)
+        await asyncio.sleep(0.01)
+        returning = RecordingWebSocket()
+        resumed = await server.manager.connect(returning, "comp-1", since=1, epoch=server.manager.node_id)
+        await asyncio.sleep(0.04)
+        kept = "comp-1" in server.manager.event_logs
+        server.manager.disconnect(returning)
+        await asyncio.sleep(0.04)
+        return resumed, kept
+
+    resumed, kept = asyncio.run(scenario())
+
+    assert resumed and kept
+    assert server.manager.event_logs == {}
+    assert server.manager.rooms == {}